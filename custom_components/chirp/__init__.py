@@ -8,8 +8,9 @@ from pathlib import Path
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
 
-from .const import CONF_APPLICATION_ID, DOMAIN, GRPCLIENT, MQTTCLIENT
+from .const import CONF_APPLICATION_ID, DEVICE_SET_FILE, DISCOVERY_CACHE_FILE, DOMAIN, GRPCLIENT, MQTTCLIENT, VALUES_STORE_FILE
 from .grpc import ChirpGrpc
 from .mqtt import ChirpToHA
 
@@ -39,7 +40,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     )
     hass.data.setdefault(DOMAIN, {})
 
-    grpc_client = ChirpGrpc(entry.data, __version__)
+    grpc_client = ChirpGrpc(entry.data, __version__, hass.config.path(STORAGE_DIR, DISCOVERY_CACHE_FILE))
     try:
         module_dir = Path(globals().get("__file__", "./_")).absolute().parent
         with Path.open(str(module_dir)+'/classes.json') as file:
@@ -47,14 +48,19 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     except Exception:  # noqa: BLE001
         classes = None
 
-    mqtt_client = ChirpToHA(entry.data, __version__, classes, grpc_client)
+    mqtt_client = ChirpToHA(
+        entry.data, __version__, classes, grpc_client,
+        values_store_file=hass.config.path(STORAGE_DIR, VALUES_STORE_FILE),
+        device_set_file=hass.config.path(STORAGE_DIR, DEVICE_SET_FILE),
+    )
 
     hass.data[DOMAIN][entry.entry_id] = {
         GRPCLIENT: grpc_client,
         MQTTCLIENT: mqtt_client,
     }
 
-    hass.async_add_executor_job( mqtt_client._client.loop_forever )
+    if not mqtt_client.start_transport(hass.loop):
+        hass.async_add_executor_job( mqtt_client._client.loop_forever )
 
     # This creates each HA object for each platform your device requires.
     # It's done by calling the `async_setup_entry` function in each platform module.
@@ -0,0 +1,118 @@
+"""The ChirpStack LoRaWAN Integration - compact MQTT discovery payloads."""
+from __future__ import annotations
+
+import json
+
+TOPIC_BASE = "~"
+COMPACT_SEPARATORS = (",", ":")
+
+ABBREVIATIONS = {     # HA MQTT discovery abbreviations of keys used by device/bridge entity configurations
+    "availability": "avty",
+    "availability_mode": "avty_mode",
+    "availability_template": "avty_tpl",
+    "availability_topic": "avty_t",
+    "command_template": "cmd_tpl",
+    "command_topic": "cmd_t",
+    "components": "cmps",
+    "device": "dev",
+    "device_class": "dev_cla",
+    "enabled_by_default": "en",
+    "entity_category": "ent_cat",
+    "expire_after": "exp_aft",
+    "force_update": "frc_upd",
+    "icon": "ic",
+    "json_attributes_template": "json_attr_tpl",
+    "json_attributes_topic": "json_attr_t",
+    "options": "ops",
+    "origin": "o",
+    "payload_available": "pl_avail",
+    "payload_not_available": "pl_not_avail",
+    "payload_off": "pl_off",
+    "payload_on": "pl_on",
+    "payload_press": "pl_prs",
+    "platform": "p",
+    "retain": "ret",
+    "state_class": "stat_cla",
+    "state_off": "stat_off",
+    "state_on": "stat_on",
+    "state_template": "stat_tpl",
+    "state_topic": "stat_t",
+    "suggested_display_precision": "sug_dsp_prc",
+    "unique_id": "uniq_id",
+    "unit_of_measurement": "unit_of_meas",
+    "value_template": "val_tpl",
+}
+
+DEVICE_ABBREVIATIONS = {
+    "configuration_url": "cu",
+    "connections": "cns",
+    "hw_version": "hw",
+    "identifiers": "ids",
+    "manufacturer": "mf",
+    "model": "mdl",
+    "model_id": "mdl_id",
+    "serial_number": "sn",
+    "suggested_area": "sa",
+    "sw_version": "sw",
+}
+
+ORIGIN_ABBREVIATIONS = {
+    "support_url": "url",
+    "sw_version": "sw",
+}
+
+AVAILABILITY_ABBREVIATIONS = {
+    "payload_available": "pl_avail",
+    "payload_not_available": "pl_not_avail",
+    "topic": "t",
+    "value_template": "val_tpl",
+}
+
+
+def abbreviate(struct, abbreviations):
+    """Get copy of dictionary with abbreviated keys, unknown keys are kept."""
+    return {abbreviations.get(key, key): value for key, value in struct.items()}
+
+
+def use_topic_base(topic, base_topic):
+    """Replace topic base by ~, None if topic is not below base."""
+    if base_topic and isinstance(topic, str) and topic.startswith(base_topic):
+        return TOPIC_BASE + topic[len(base_topic):]
+    return None
+
+
+def compact_discovery_config(config, base_topic=None):
+    """Get discovery config with abbreviated keys and topics below base_topic written relative to ~."""
+    compact = {}
+    base_used = False
+    for key, value in config.items():
+        if key == "device":
+            value = abbreviate(value, DEVICE_ABBREVIATIONS)
+        elif key == "origin":
+            value = abbreviate(value, ORIGIN_ABBREVIATIONS)
+        elif key == "availability" and isinstance(value, list):
+            items = []
+            for item in value:
+                item = abbreviate(item, AVAILABILITY_ABBREVIATIONS)
+                topic = use_topic_base(item.get("t"), base_topic)
+                if topic:
+                    item["t"] = topic
+                    base_used = True
+                items.append(item)
+            value = items
+        elif key == "components":
+            value = {object_id: compact_discovery_config(component, base_topic) for object_id, component in value.items()}
+        elif key.endswith("topic"):
+            topic = use_topic_base(value, base_topic)
+            if topic:
+                value = topic
+                base_used = True
+        compact[ABBREVIATIONS.get(key, key)] = value
+    if base_used:
+        compact[TOPIC_BASE] = base_topic
+    return compact
+
+
+def dump_discovery_config(config, compact=False):
+    """Serialize discovery config, without blanks in compact mode."""
+    return json.dumps(config, separators=COMPACT_SEPARATORS) if compact else json.dumps(config)
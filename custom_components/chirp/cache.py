@@ -0,0 +1,131 @@
+"""The ChirpStack LoRaWAN Integration - persistent discovery codec results and device set caches."""
+from __future__ import annotations
+
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DiscoveryCache:
+    """Map discovery codec source hash to parsed getHaDeviceInfo result, keep it in file between restarts."""
+
+    def __init__(self, file_name, max_size) -> None:
+        """Initialize cache and load previously stored entries."""
+        self._file_name = file_name
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._changed = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def codec_hash(codec_code):
+        """Get cache key for discovery codec source."""
+        return hashlib.sha256(codec_code.encode("utf-8")).hexdigest()
+
+    def load(self):
+        """Load cache entries from file, start with empty cache if file is missing or corrupted."""
+        if not self._file_name or not os.path.exists(self._file_name):
+            return
+        try:
+            with open(self._file_name, encoding="utf-8") as file:
+                self._entries = OrderedDict(json.load(file))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning("Discovery cache %s load failed: %s", self._file_name, str(error))
+            self._entries = OrderedDict()
+        self.evict()
+        _LOGGER.debug("Discovery cache %s loaded, %s entries", self._file_name, len(self._entries))
+
+    def save(self):
+        """Store cache entries to file if changed since last load/save."""
+        if not self._file_name or not self._changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._file_name), exist_ok=True)
+            temp_file_name = self._file_name + ".tmp"
+            with open(temp_file_name, "w", encoding="utf-8") as file:
+                json.dump(self._entries, file)
+            os.replace(temp_file_name, self._file_name)
+            self._changed = False
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning("Discovery cache %s save failed: %s", self._file_name, str(error))
+
+    def evict(self):
+        """Remove least recently used entries above cache size limit."""
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._changed = True
+
+    def get(self, codec_code):
+        """Get copy of discovery structure for codec source, None if not cached."""
+        key = self.codec_hash(codec_code)
+        discovery = self._entries.get(key)
+        if discovery is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return copy.deepcopy(discovery)
+
+    def put(self, codec_code, discovery):
+        """Add discovery structure for codec source to cache."""
+        key = self.codec_hash(codec_code)
+        self._entries[key] = copy.deepcopy(discovery)
+        self._entries.move_to_end(key)
+        self._changed = True
+        self.evict()
+
+
+class DeviceSetCache:
+    """Keep discovery messages of last successfully reloaded device set in file between restarts."""
+
+    def __init__(self, file_name) -> None:
+        """Initialize cache and load previously stored device set."""
+        self._file_name = file_name
+        self.device_set = None
+        self.load()
+
+    def load(self):
+        """Load device set from file, no device set if file is missing or corrupted."""
+        if not self._file_name or not os.path.exists(self._file_name):
+            return
+        try:
+            with open(self._file_name, encoding="utf-8") as file:
+                self.device_set = self.validate(json.load(file))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning("Device set cache %s load failed: %s", self._file_name, str(error))
+            self.device_set = None
+            return
+        _LOGGER.debug("Device set cache %s loaded, %s device(s)", self._file_name, len(self.device_set["devices"]))
+
+    @staticmethod
+    def validate(device_set):
+        """Check loaded device set structure, throws error for file of other version or format."""
+        if (
+            not isinstance(device_set, dict)
+            or not isinstance(device_set.get("devices"), dict)
+            or not all(isinstance(sensors, int) for sensors in device_set["devices"].values())
+            or not isinstance(device_set.get("configs"), dict)
+            or not all(isinstance(config, list) and len(config) == 2 for config in device_set["configs"].values())
+            or not isinstance(device_set.get("fields"), (dict, type(None)))
+        ):
+            raise ValueError("unexpected device set structure")
+        return device_set
+
+    def save(self, device_set):
+        """Store device set to file."""
+        self.device_set = device_set
+        try:
+            os.makedirs(os.path.dirname(self._file_name), exist_ok=True)
+            temp_file_name = self._file_name + ".tmp"
+            with open(temp_file_name, "w", encoding="utf-8") as file:
+                json.dump(device_set, file)
+            os.replace(temp_file_name, self._file_name)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning("Device set cache %s save failed: %s", self._file_name, str(error))
@@ -62,6 +62,53 @@ BRIDGE_RESTART_NAME = "Reload devices"
 STATISTICS_SENSORS = "chirp_sensors"
 STATISTICS_DEVICES = "chirp_devices"
 STATISTICS_UPDATED = "chirp_updated"
+STATISTICS_QUEUE = "chirp_queue"
+STATISTICS_OVERFLOW = "chirp_overflow"
+STATISTICS_STARTUP = "chirp_startup"
+STATISTICS_PUBLISH_RATE = "chirp_publish_rate"
+STATISTICS_PUBLISH_THROTTLED = "chirp_publish_throttled"
+
+CONF_OPTIONS_DISCOVERY_CACHE_SIZE = "options_discovery_cache_size"
+DEFAULT_OPTIONS_DISCOVERY_CACHE_SIZE = 256
+DISCOVERY_CACHE_FILE = "chirp_discovery_cache.json"
+CONF_OPTIONS_GRPC_WORKERS = "options_grpc_workers"
+DEFAULT_OPTIONS_GRPC_WORKERS = 4
+CONF_OPTIONS_GRPC_PAGE_SIZE = "options_grpc_page_size"
+DEFAULT_OPTIONS_GRPC_PAGE_SIZE = 100
+CONF_OPTIONS_RELOAD_QUEUE_SIZE = "options_reload_queue_size"
+DEFAULT_OPTIONS_RELOAD_QUEUE_SIZE = 64
+CONF_OPTIONS_INCREMENTAL_RELOAD = "options_incremental_reload"
+DEFAULT_OPTIONS_INCREMENTAL_RELOAD = False
+CONF_OPTIONS_MESSAGE_WORKERS = "options_message_workers"
+DEFAULT_OPTIONS_MESSAGE_WORKERS = 4
+CONF_OPTIONS_MESSAGE_QUEUE_SIZE = "options_message_queue_size"
+DEFAULT_OPTIONS_MESSAGE_QUEUE_SIZE = 1000
+CONF_OPTIONS_MESSAGE_OVERFLOW_SIZE = "options_message_overflow_size"
+DEFAULT_OPTIONS_MESSAGE_OVERFLOW_SIZE = 10000
+CONF_OPTIONS_ASYNCIO_TRANSPORT = "options_asyncio_transport"
+DEFAULT_OPTIONS_ASYNCIO_TRANSPORT = False
+CONF_OPTIONS_RESTORE_COMPLETION = "options_restore_completion"
+DEFAULT_OPTIONS_RESTORE_COMPLETION = False
+CONF_OPTIONS_VALUES_STORE = "options_values_store"
+DEFAULT_OPTIONS_VALUES_STORE = False
+CONF_OPTIONS_VALUES_STORE_FLUSH = "options_values_store_flush"
+DEFAULT_OPTIONS_VALUES_STORE_FLUSH = 5
+VALUES_STORE_FILE = "chirp_values_{}.db"
+CONF_OPTIONS_STALE_STARTUP = "options_stale_startup"
+DEFAULT_OPTIONS_STALE_STARTUP = False
+CONF_OPTIONS_REVALIDATE_RETRY = "options_revalidate_retry"
+DEFAULT_OPTIONS_REVALIDATE_RETRY = 60
+DEVICE_SET_FILE = "chirp_device_set_{}.json"
+CONF_OPTIONS_PUBLISH_RATE = "options_publish_rate"
+DEFAULT_OPTIONS_PUBLISH_RATE = 0
+CONF_OPTIONS_PUBLISH_WINDOW = "options_publish_window"
+DEFAULT_OPTIONS_PUBLISH_WINDOW = 0
+CONF_OPTIONS_DEVICE_DISCOVERY = "options_device_discovery"
+DEFAULT_OPTIONS_DEVICE_DISCOVERY = False
+CONF_OPTIONS_COMPACT_DISCOVERY = "options_compact_discovery"
+DEFAULT_OPTIONS_COMPACT_DISCOVERY = False
+CONF_OPTIONS_DISCOVERY_TEMPLATES = "options_discovery_templates"
+DEFAULT_OPTIONS_DISCOVERY_TEMPLATES = False
 
 CONF_OPTIONS_LOG_LEVEL = "options_log_level"
 CONF_OPTIONS_ONLINE_PER_DEVICE = "options_online_per_device"
@@ -77,6 +124,7 @@ BRIDGE_CONF_COUNT = 3
 ENTITY_CATEGORY_DIAGNOSTIC = "diagnostic"
 
 ERRMSG_CODEC_ERROR = "Profile %s discovery codec script error '%s', source code '%s' converted to json '%s'"
+ERRMSG_DEVICE_FETCH_FAILED = "Device %s (%s) details request failed with '%s', device ignored"
 ERRMSG_DEVICE_IGNORED = "Discovery codec (%s->%s) missing or faulty for device %s with profile %s, device ignored"
 WARMSG_APPID_WRONG = "'%s' is not valid application ID, using '%s' (tenant '%s', application '%s')"
 WARMSG_DEVCLS_REMOVED = "Could not detect integration by device class %s for device %s, integration set to 'sensor', device class removed"
@@ -0,0 +1,51 @@
+"""The ChirpStack LoRaWAN Integration - discovery payload templates shared by devices of the same profile."""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+
+from .abbreviations import dump_discovery_config
+
+DEV_EUI_SLOT = "chirpdeveuislot"
+DEV_NAME_SLOT = "chirpdevnameslot"
+SLOTS_PATTERN = re.compile(f"({DEV_EUI_SLOT}|{DEV_NAME_SLOT})")
+TOPIC_KEYS = ("discovery_topic", "status_topic", "comand_topic")
+
+
+class DiscoveryTemplate:
+    """Discovery payload prepared once for profile entity with device slots, device payload is assembled by filling slots."""
+
+    __slots__ = ("conf_data", "payload_format", "hash_format", "topic_formats")
+
+    def __init__(self, conf_data, compact=False) -> None:
+        """Convert serialized slot payload, its hash source and topics to format strings, valid for one reload time stamp."""
+        payload_struct = conf_data["discovery_payload_struct"]
+        self.conf_data = conf_data
+        self.payload_format = self.get_format(dump_discovery_config(payload_struct, compact))
+        self.hash_format = self.get_format(   # same source as get_config_hash
+            json.dumps({key: value for key, value in payload_struct.items() if key != "time_stamp"}, sort_keys=True)
+        )
+        self.topic_formats = {key: self.get_format(conf_data[key]) for key in TOPIC_KEYS if key in conf_data}
+
+    @staticmethod
+    def get_format(text):
+        """Convert text with slots to %-format string filled by slot values mapping."""
+        return "".join(
+            f"%({part})s" if index % 2 else part.replace("%", "%%") for index, part in enumerate(SLOTS_PATTERN.split(text))
+        )
+
+    @staticmethod
+    def slot_values(dev_eui, dev_name):
+        """Get device slot values for render."""
+        return {DEV_EUI_SLOT: dev_eui, DEV_NAME_SLOT: json.dumps(dev_name)[1:-1]}
+
+    def render(self, values):
+        """Get device discovery data in get_conf_data format from template."""
+        conf_data = dict(self.conf_data)
+        for key, topic_format in self.topic_formats.items():
+            conf_data[key] = topic_format % values
+        conf_data["dev_eui"] = values[DEV_EUI_SLOT]
+        conf_data["discovery_config"] = self.payload_format % values
+        conf_data["config_hash"] = hashlib.md5((self.hash_format % values).encode("utf-8")).hexdigest()
+        return conf_data
@@ -0,0 +1,163 @@
+"""The ChirpStack LoRaWAN Integration - keyed message dispatching to worker threads."""
+from __future__ import annotations
+
+import collections
+import logging
+import queue
+import threading
+import zlib
+
+_LOGGER = logging.getLogger(__name__)
+
+DISPATCHER_STOP = object()
+
+
+class KeyedDispatcher:
+    """Run tasks on worker threads selected by key: same key tasks run in order, different keys in parallel."""
+
+    def __init__(self, workers, queue_size, overflow_size=0, name="chirp_worker") -> None:
+        """Start worker threads with own bounded task queues, no threads for inline processing (0 workers); overflow_size limits tasks buffered by non-blocking dispatch over all workers."""
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._overflows = [collections.deque() for _ in range(workers)]  # tasks not queued by non-blocking dispatch
+        self._overflow_size = overflow_size
+        self._overflow_count = 0
+        self._overflow_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self.max_queue_depth = 0
+        self.max_overflow_depth = 0
+        self.dropped = 0
+        self.on_overflow = None     # called with True once overflow reaches half of its limit, with False once drained
+        self._overflow_paused = False
+        self.processed = 0
+        for index, task_queue in enumerate(self._queues):
+            threading.Thread(
+                target=self.worker, args=(index,), name=f"{name}_{index}", daemon=True
+            ).start()
+
+    def queue_depth(self):
+        """Get number of tasks waiting in all worker queues."""
+        return sum(task_queue.qsize() for task_queue in self._queues)
+
+    def overflow_depth(self):
+        """Get number of tasks buffered in worker overflows."""
+        return self._overflow_count
+
+    def is_idle(self):
+        """Check if all dispatched tasks are processed."""
+        return all(not task_queue.unfinished_tasks for task_queue in self._queues) and not any(self._overflows)
+
+    def put(self, index, item, block=True, droppable=True):
+        """Queue item for worker, wait for free queue space or buffer item in worker overflow if not blocking, droppable item is dropped if overflow is full."""
+        if block:
+            self._queues[index].put(item)
+            return
+        with self._overflow_lock:
+            overflow = self._overflows[index]
+            if not overflow:
+                try:
+                    self._queues[index].put_nowait(item)
+                    return
+                except queue.Full:
+                    _LOGGER.warning("Worker %s queue is full, tasks are buffered till worker catches up", index)
+            if droppable and self._overflow_count >= self._overflow_size:
+                if not self.dropped % 1000:
+                    _LOGGER.warning("Worker overflow limit %s reached, %s task(s) dropped", self._overflow_size, self.dropped + 1)
+                self.dropped += 1
+                return
+            overflow.append(item)
+            self._overflow_count += 1
+            self.max_overflow_depth = max(self.max_overflow_depth, self._overflow_count)
+            if self.on_overflow and not self._overflow_paused and self._overflow_count >= self._overflow_size // 2:
+                self._overflow_paused = True
+                self.on_overflow(True)
+
+    def move_overflow(self, index):
+        """Move buffered tasks to worker queue while it has free space, keeping dispatch order."""
+        with self._overflow_lock:
+            overflow = self._overflows[index]
+            while overflow:
+                try:
+                    self._queues[index].put_nowait(overflow[0])
+                except queue.Full:
+                    break
+                overflow.popleft()
+                self._overflow_count -= 1
+            if self._overflow_paused and not self._overflow_count:
+                self._overflow_paused = False
+                self.on_overflow(False)
+
+    def dispatch(self, key, task, *args, block=True):
+        """Queue task for worker selected by key, wait for free queue space if blocking; run task inline if no workers."""
+        if not self._queues:
+            task(*args)
+            with self._metrics_lock:
+                self.processed += 1
+            return
+        self.put(zlib.crc32(str(key).encode()) % len(self._queues), (task, args), block)
+        queue_depth = self.queue_depth()
+        if queue_depth > self.max_queue_depth:
+            with self._metrics_lock:
+                self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def dispatch_barrier(self, task, *args, block=True):
+        """Run task once after tasks queued before it are processed on every worker."""
+        if not self._queues:
+            task(*args)
+            return
+        remaining = [len(self._queues)]
+        barrier_lock = threading.Lock()
+
+        def arrive():
+            with barrier_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                task(*args)
+
+        for index in range(len(self._queues)):
+            self.put(index, (arrive, ()), block, droppable=False)
+
+    def worker(self, index):
+        """Thread app to process queued tasks till dispatcher is closed."""
+        task_queue = self._queues[index]
+        while not self._stop.is_set():
+            item = task_queue.get()
+            try:
+                if item is DISPATCHER_STOP:
+                    break
+                task, args = item
+                task(*args)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                _LOGGER.error("Message processing failed: %s", str(error))
+            finally:
+                if item is not DISPATCHER_STOP:
+                    with self._metrics_lock:
+                        self.processed += 1
+                task_queue.task_done()
+                if self._overflows[index]:
+                    self.move_overflow(index)
+
+    def join(self):
+        """Wait till all dispatched tasks are processed."""
+        while True:
+            for task_queue in self._queues:
+                task_queue.join()
+            if not any(self._overflows):
+                break
+
+    def get_queue_info(self):
+        """Get queue depth metrics as printable string."""
+        return (
+            f"queue depth {self.queue_depth()}, max queue depth {self.max_queue_depth}, overflow depth {self.overflow_depth()}, "
+            f"max overflow depth {self.max_overflow_depth}, dropped {self.dropped}, processed {self.processed}"
+        )
+
+    def close(self):
+        """Stop worker threads after their current task, remaining tasks are dropped."""
+        self._stop.set()
+        for task_queue in self._queues:
+            try:
+                task_queue.put_nowait(DISPATCHER_STOP)
+            except queue.Full:
+                pass
@@ -1,18 +1,28 @@
 """The ChirpStack LoRaWAN Integration - grpc interface to ChirpStack server."""
 from __future__ import annotations
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import copy
 import json
 import logging
 import subprocess
+import threading
+import time
 import dukpy
 import re
 
 from chirpstack_api import api
 import grpc
 
+from .cache import DiscoveryCache
 from .getha import generate_getHaDeviceInfo
 from .const import CONF_API_PORT, CONF_API_SERVER, CONF_APPLICATION_ID, CHIRPSTACK_TENANT, CHIRPSTACK_APPLICATION, ERRMSG_CODEC_ERROR
 from .const import ERRMSG_DEVICE_IGNORED, WARMSG_APPID_WRONG, CHIRPSTACK_API_KEY_NAME, CONF_API_KEY
+from .const import CONF_OPTIONS_DISCOVERY_CACHE_SIZE, DEFAULT_OPTIONS_DISCOVERY_CACHE_SIZE
+from .const import CONF_OPTIONS_GRPC_WORKERS, DEFAULT_OPTIONS_GRPC_WORKERS, ERRMSG_DEVICE_FETCH_FAILED
+from .const import CONF_OPTIONS_GRPC_PAGE_SIZE, DEFAULT_OPTIONS_GRPC_PAGE_SIZE
+from .const import CONF_OPTIONS_STALE_STARTUP, DEFAULT_OPTIONS_STALE_STARTUP
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -20,11 +30,12 @@ class ChirpGrpc:
     """Chirp2MQTT grpc interface support."""
     """ChirpStack api details @ https://github.com/chirpstack/chirpstac k/tree/master/api/proto/api"""
 
-    def __init__(self, config, version) -> None:
+    def __init__(self, config, version, cache_file=None) -> None:
         """Open connection to ChirpStack api server."""
         self._config = config
         self._version = version
         self._application_id = self._config.get(CONF_APPLICATION_ID)
+        self._page_size = max(1, int(self._config.get(CONF_OPTIONS_GRPC_PAGE_SIZE, DEFAULT_OPTIONS_GRPC_PAGE_SIZE)))
         self._channel = grpc.insecure_channel(
             f"{self._config.get(CONF_API_SERVER)}:{self._config.get(CONF_API_PORT)}"
         )
@@ -41,6 +52,30 @@ class ChirpGrpc:
             self._config.get(CONF_API_PORT),
             self._token_id,
         )
+        self._application_checked = False
+        if self._config.get(CONF_OPTIONS_STALE_STARTUP, DEFAULT_OPTIONS_STALE_STARTUP):
+            _LOGGER.info("Check of application id %s deferred to devices reload", self._application_id)
+        else:
+            self.check_application_id()
+        self.js_interpreter = dukpy.JSInterpreter()
+        self._profiles = {}
+        self._profile_requests = {}
+        self._profile_requests_lock = threading.Lock()
+        self._incremental = False
+        self._devices_state = {}
+        self._next_devices_state = {}
+        self._snapshot_profiles = {}
+        self._unchanged_count = 0
+        self._uplink_intervals = {}
+        self._visibility = {}
+        self._grpc_workers = max(1, int(self._config.get(CONF_OPTIONS_GRPC_WORKERS, DEFAULT_OPTIONS_GRPC_WORKERS)))
+        self._codec_time = 0
+        cache_size = self._config.get(CONF_OPTIONS_DISCOVERY_CACHE_SIZE, DEFAULT_OPTIONS_DISCOVERY_CACHE_SIZE)
+        self._discovery_cache = DiscoveryCache(cache_file, cache_size) if cache_file and cache_size else None
+        _LOGGER.info("ChirpStack application ID %s", self._application_id)
+
+    def check_application_id(self):
+        """Check configured application id, use first available application (created if missing) if id is not valid."""
         if not self.is_valid_app_id( self._application_id ):
             tenants_on_chirp = self.get_chirp_tenants()
             if len(tenants_on_chirp) == 0:
@@ -69,32 +104,56 @@ class ChirpGrpc:
                 break
             _LOGGER.warning(WARMSG_APPID_WRONG, self._application_id, application_id, tenant, application)
             self._application_id = application_id
-        self.js_interpreter = dukpy.JSInterpreter()
-        _LOGGER.info("ChirpStack application ID %s", self._application_id)
+        self._application_checked = True
+
+    def check_deferred_application_id(self):
+        """Check application id skipped at stale startup, configured id is kept as mqtt topics are already built on it."""
+        if self._application_checked:
+            return
+        configured_id = self._application_id
+        self.check_application_id()
+        if self._application_id != configured_id:
+            _LOGGER.error("Configured application id %s not valid, integration reconfiguration needed", configured_id)
+            self._application_id = configured_id
+
+    def get_list_page(self, list_call, list_request, offset):
+        """Get single page of List api call results starting from offset."""
+        request = list_request()
+        request.limit = self._page_size
+        request.offset = offset
+        return list_call(request, metadata=self._auth_token)
+
+    def list_paged(self, list_call, list_request):
+        """Yield List api call results page by page, next page is requested while current one is processed."""
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="chirp_list") as executor:
+            offset = 0
+            page_request = executor.submit(self.get_list_page, list_call, list_request, offset)
+            while page_request:
+                page = page_request.result()
+                offset += len(page.result)
+                if len(page.result) < self._page_size or offset >= page.total_count:
+                    page_request = None
+                else:
+                    page_request = executor.submit(self.get_list_page, list_call, list_request, offset)
+                yield from page.result
 
     def get_chirp_tenants(self):
         """Get tenant list from api server, build name/id dictionary and return."""
         tenants = api.TenantServiceStub(self._channel)
-        listTenantsReq = api.ListTenantsRequest()
-        tenantsResp = tenants.List(listTenantsReq, metadata=self._auth_token)
-        listTenantsReq.limit = tenantsResp.total_count
-        tenantsResp = tenants.List(listTenantsReq, metadata=self._auth_token)
-        return {tenant.name: tenant.id for tenant in tenantsResp.result}
+        return {tenant.name: tenant.id for tenant in self.list_paged(tenants.List, api.ListTenantsRequest)}
 
     def get_tenant_applications(self, tenant_id):
         """Get applications list from api server, build name/id dictionary and return."""
         applications = api.ApplicationServiceStub(self._channel)
-        listApplicationsReq = api.ListApplicationsRequest()
-        listApplicationsReq.tenant_id = tenant_id
-        applicationsResp = applications.List(
-            listApplicationsReq, metadata=self._auth_token
-        )
-        listApplicationsReq.limit = applicationsResp.total_count
-        applicationsResp = applications.List(
-            listApplicationsReq, metadata=self._auth_token
-        )
+
+        def list_applications_request():
+            listApplicationsReq = api.ListApplicationsRequest()
+            listApplicationsReq.tenant_id = tenant_id
+            return listApplicationsReq
+
         return {
-            application.name: application.id for application in applicationsResp.result
+            application.name: application.id
+            for application in self.list_paged(applications.List, list_applications_request)
         }
 
     def is_valid_app_id(self, application_id):
@@ -109,14 +168,33 @@ class ChirpGrpc:
         return True
 
     def get_chirp_app_devices(self):
-        """Get application's devices from api server."""
+        """Get application's devices from api server, devices are yielded page by page."""
         devices = api.DeviceServiceStub(self._channel)
-        listDevicesReq = api.ListDevicesRequest()
-        listDevicesReq.application_id = self._application_id
-        devicesResp = devices.List(listDevicesReq, metadata=self._auth_token)
-        listDevicesReq.limit = devicesResp.total_count
-        devicesResp = devices.List(listDevicesReq, metadata=self._auth_token)
-        return devicesResp.result
+
+        def list_devices_request():
+            listDevicesReq = api.ListDevicesRequest()
+            listDevicesReq.application_id = self._application_id
+            return listDevicesReq
+
+        return self.list_paged(devices.List, list_devices_request)
+
+    def get_profiles_updated_at(self):
+        """Get application's tenant device profiles last update time stamps from api server."""
+        application = api.ApplicationServiceStub(self._channel)
+        applicationReq = api.GetApplicationRequest()
+        applicationReq.id = self._application_id
+        tenant_id = application.Get(applicationReq, metadata=self._auth_token).application.tenant_id
+        profiles = api.DeviceProfileServiceStub(self._channel)
+
+        def list_profiles_request():
+            listProfilesReq = api.ListDeviceProfilesRequest()
+            listProfilesReq.tenant_id = tenant_id
+            return listProfilesReq
+
+        return {
+            profile.id: str(profile.updated_at)
+            for profile in self.list_paged(profiles.List, list_profiles_request)
+        }
 
     #   [desc.name for desc, val in deviceReq.ListFields()]
     def get_chirp_device(self, dev_eui):
@@ -149,68 +227,65 @@ class ChirpGrpc:
         """Close grpc channel."""
         self._channel.close()
 
-    def get_current_device_entities(self):
-        """Get enabled device list from api server."""
-        devices_list = []
-        devices = self.get_chirp_app_devices()
-        for device in devices:
-            if self.isDeviceDisbled(device.dev_eui):
-                continue
-            profile = self.get_chirp_device_profile(device.device_profile_id)
-            discovery = None
-            codec_code = None
-            codec_json = None
-            try:
+    def get_profile_discovery(self, profile, device):
+        """Evaluate profile's getHaDeviceInfo codec, return discovery structure (None if codec missing or faulty), codec source and codec json."""
+        discovery = None
+        cached_discovery = None
+        codec_code = None
+        codec_json = None
+        try:
+            mi_start = re.search(r"function\s+getHaDeviceInfo", profile.device_profile.payload_codec_script)
+            if not mi_start:
+                _LOGGER.warning(
+                    "Profile %s discovery codec script not found, generating one, will use manufacturer name '%s', device name '%s', baterry '%s'",
+                    profile.device_profile.name,
+                    profile.device_profile.description,
+                    profile.device_profile.name,
+                    not device.device_status.external_power_source
+                )
+                codec_code = generate_getHaDeviceInfo(profile.device_profile.payload_codec_script,
+                                                      profile.device_profile.description,
+                                                      profile.device_profile.name,
+                                                      not device.device_status.external_power_source)
+                profile.device_profile.payload_codec_script += codec_code
+                self.update_chirp_device_profile(profile.device_profile)
                 mi_start = re.search(r"function\s+getHaDeviceInfo", profile.device_profile.payload_codec_script)
-                if not mi_start:
-                    _LOGGER.warning(
-                        "Profile %s discovery codec script not found, generating one, will use manufacturer name '%s', device name '%s', baterry '%s'",
-                        profile.device_profile.name,
-                        profile.device_profile.description,
-                        profile.device_profile.name,
-                        not device.device_status.external_power_source
-                    )
-                    codec_code = generate_getHaDeviceInfo(profile.device_profile.payload_codec_script,
-                                                          profile.device_profile.description,
-                                                          profile.device_profile.name,
-                                                          not device.device_status.external_power_source)
-                    profile.device_profile.payload_codec_script += codec_code
-                    self.update_chirp_device_profile(profile.device_profile)
-                    mi_start = re.search(r"function\s+getHaDeviceInfo", profile.device_profile.payload_codec_script)
-                if mi_start:
-                    i_start = mi_start.start()
-                    codec_code = profile.device_profile.payload_codec_script[i_start:]
+            if mi_start:
+                i_start = mi_start.start()
+                codec_code = profile.device_profile.payload_codec_script[i_start:]
+                if self._discovery_cache:
+                    cached_discovery = self._discovery_cache.get(codec_code)
+                if not cached_discovery:
+                    codec_start = time.time()
                     discovery = self.js_interpreter.evaljs(codec_code+"; JSON.stringify(getHaDeviceInfo())")
+                    self._codec_time += time.time() - codec_start
                     codec_json = discovery
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.error(
+                ERRMSG_CODEC_ERROR,
+                profile.device_profile.name,
+                str(error),
+                codec_code,
+                codec_json,
+            )
+            discovery = None
+        if discovery:
+            try:
+                discovery = json.loads(discovery)
+                if self._discovery_cache:
+                    self._discovery_cache.put(codec_code, discovery)
             except Exception as error:  # pylint: disable=broad-exception-caught
-                _LOGGER.error(
-                    ERRMSG_CODEC_ERROR,
+                _LOGGER.debug(
+                    "Profile %s discovery codec script error '%s', source code '%s' converted to json '%s'",
                     profile.device_profile.name,
                     str(error),
                     codec_code,
-                    codec_json,
+                    discovery,
                 )
                 discovery = None
-            if discovery:
-                try:
-                    discovery = json.loads(discovery)
-                except Exception as error:  # pylint: disable=broad-exception-caught
-                    _LOGGER.debug(
-                        "Profile %s discovery codec script error '%s', source code '%s' converted to json '%s'",
-                        profile.device_profile.name,
-                        str(error),
-                        codec_code,
-                        discovery,
-                    )
-                    discovery = None
-            if not discovery:
-                _LOGGER.error(
-                    ERRMSG_DEVICE_IGNORED,
-                    codec_code, codec_json,
-                    device.name,
-                    profile.device_profile.name,
-                )
-                continue
+        if cached_discovery:
+            discovery = cached_discovery
+        if discovery:
             for entity, config in discovery["entities"].items():
                 discovery_config = config["entity_conf"]
                 if not discovery_config.get("value_template"):
@@ -218,18 +293,148 @@ class ChirpGrpc:
                         "value_template"
                     ] = f"{{{{ value_json.object.{entity} }}}}"
                 discovery_config["uplink_interval"] = profile.device_profile.uplink_interval
+        return discovery, codec_code, codec_json
+
+    def get_shared_device_profile(self, device_profile_id):
+        """Get device profile from api server once per reload, concurrent requests for the same profile wait for the first one."""
+        with self._profile_requests_lock:
+            profile_request = self._profile_requests.get(device_profile_id)
+            request_owner = profile_request is None
+            if request_owner:
+                profile_request = Future()
+                self._profile_requests[device_profile_id] = profile_request
+        if request_owner:
+            try:
+                profile_request.set_result(self.get_chirp_device_profile(device_profile_id))
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                profile_request.set_exception(error)
+        return profile_request.result()
+
+    @staticmethod
+    def get_device_state_key(device):
+        """Get device list details used to detect device changes between reloads."""
+        return (device.device_profile_id, device.name, str(getattr(device, "updated_at", "")))
+
+    def get_device_details(self, device):
+        """Get device profile for enabled device, None for disabled one; executed by grpc worker pool."""
+        device_key = self.get_device_state_key(device)
+        if self._incremental:
+            device_state = self._devices_state.get(device.dev_eui)
+            if device_state and device_state[0] == device_key:
+                self._next_devices_state[device.dev_eui] = device_state
+                self._unchanged_count += 1
+                if device_state[1]:
+                    return None
+                if device.device_profile_id in self._profiles:
+                    return self._profiles[device.device_profile_id]["profile"]
+                return self.get_shared_device_profile(device.device_profile_id)
+        is_disabled = self.isDeviceDisbled(device.dev_eui)
+        self._next_devices_state[device.dev_eui] = (device_key, is_disabled)
+        if is_disabled:
+            return None
+        return self.get_shared_device_profile(device.device_profile_id)
 
+    def fetch_ordered(self, fetch, items):
+        """Run fetch for items on grpc worker pool with bounded number of requests in flight, yield (item, result, error) in items order."""
+
+        def fetch_result(item, request):
+            try:
+                return item, request.result(), None
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                return item, None, error
+
+        with ThreadPoolExecutor(max_workers=self._grpc_workers, thread_name_prefix="chirp_grpc") as executor:
+            in_flight = deque()
+            for item in items:
+                in_flight.append((item, executor.submit(fetch, item)))
+                if len(in_flight) >= self._grpc_workers:
+                    yield fetch_result(*in_flight.popleft())
+            while in_flight:
+                yield fetch_result(*in_flight.popleft())
+
+    def get_profile_details(self, device, profile):
+        """Get device profile discovery details from per reload cache, evaluate profile codec on first use."""
+        profile_details = self._profiles.get(device.device_profile_id)
+        if not profile_details:
+            discovery, codec_code, codec_json = self.get_profile_discovery(profile, device)
             mac_version = (
                 profile.device_profile.DESCRIPTOR.fields_by_name["mac_version"]
                 .enum_type.values_by_number[profile.device_profile.mac_version]
                 .name
             )
-            mac_version = (mac_version.replace("_", " ", 1)).replace("_", ".")
+            profile_details = {
+                "profile": profile,
+                "updated_at": str(getattr(profile, "updated_at", "")),
+                "discovery": discovery,
+                "codec_code": codec_code,
+                "codec_json": codec_json,
+                "sw_version": (mac_version.replace("_", " ", 1)).replace("_", "."),
+            }
+            self._profiles[device.device_profile_id] = profile_details
+            self.set_uplink_intervals(profile)
+        return profile_details
+
+    def get_current_device_entities(self):
+        """Get enabled device list from api server."""
+        return list(self.iter_current_device_entities())
+
+    def iter_current_device_entities(self):
+        """Yield enabled devices discovery details while device list pages are retrieved from api server."""
+        devices = iter(())
+        for _, stage in self.get_device_entities_stages():
+            devices = stage(devices)
+        return devices
+
+    def get_device_entities_stages(self, incremental=False):
+        """Get device discovery processing stages: device list, device details fetch and codec evaluation."""
+        self._profiles = {}
+        self._profile_requests = {}
+        self._next_devices_state = {}
+        self._unchanged_count = 0
+        self._codec_time = 0
+        self._incremental = incremental and bool(self._devices_state)
+        if self._incremental:
+            try:
+                profiles_updated_at = self.get_profiles_updated_at()
+                self._profiles = {
+                    profile_id: profile_details
+                    for profile_id, profile_details in self._snapshot_profiles.items()
+                    if profiles_updated_at.get(profile_id) == profile_details["updated_at"]
+                }
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                _LOGGER.warning("Device profiles list request failed with '%s', full reload used", str(error))
+                self._incremental = False
+        return [
+            ("list", lambda _: self.get_chirp_app_devices()),
+            ("fetch", lambda devices: self.fetch_ordered(self.get_device_details, devices)),
+            ("codec", self.evaluate_device_entities),
+        ]
+
+    def evaluate_device_entities(self, fetched_devices):
+        """Yield discovery details for fetched enabled devices, evaluate profile codecs on first use."""
+        devices_count = 0
+        for device, profile, error in fetched_devices:
+            if error:
+                _LOGGER.error(ERRMSG_DEVICE_FETCH_FAILED, device.dev_eui, device.name, str(error))
+                continue
+            if not profile:
+                continue
+            profile_details = self.get_profile_details(device, profile)
+            if not profile_details["discovery"]:
+                _LOGGER.error(
+                    ERRMSG_DEVICE_IGNORED,
+                    profile_details["codec_code"], profile_details["codec_json"],
+                    device.name,
+                    profile.device_profile.name,
+                )
+                continue
+            discovery = copy.deepcopy(profile_details["discovery"])
             discovery["dev_conf"] = {
                 "last_seen": device.last_seen_at if str(device.last_seen_at) else None,
-                "sw_version": mac_version,
+                "sw_version": profile_details["sw_version"],
                 "dev_eui": device.dev_eui,
                 "dev_name": device.name,
+                "profile_id": profile.device_profile.id,
                 "measurement_names": {
                     entity: profile.device_profile.measurements[entity].name
                     for entity in discovery["entities"]
@@ -238,15 +443,66 @@ class ChirpGrpc:
                 if not device.device_status.external_power_source
                 else {},
             }
-            devices_list.append(discovery)
-        return devices_list
+            devices_count += 1
+            yield discovery
+        _LOGGER.debug("%s device(s) processed using %s profile(s)", devices_count, len(self._profiles))
+        if self._incremental:
+            _LOGGER.info(
+                "Incremental reload: %s device(s) unchanged, %s device(s) fetched",
+                self._unchanged_count,
+                len(self._next_devices_state) - self._unchanged_count,
+            )
+        self._devices_state = self._next_devices_state
+        self._snapshot_profiles = self._profiles
+        if self._discovery_cache:
+            self._discovery_cache.save()
+            _LOGGER.info(
+                "Discovery cache %s hit(s), %s miss(es), codec evaluation time %.3fs",
+                self._discovery_cache.hits,
+                self._discovery_cache.misses,
+                self._codec_time,
+            )
+
+    @staticmethod
+    def get_last_seen(last_seen_at):
+        """Convert api server last seen time stamp to seconds, 0 if device not seen yet."""
+        return last_seen_at.seconds+last_seen_at.nanos*1e-9 if str(last_seen_at) else 0
+
+    def set_uplink_intervals(self, profile):
+        """Keep device profile uplink and status request intervals for visibility checks."""
+        intervals = (profile.device_profile.uplink_interval, profile.device_profile.device_status_req_interval)
+        self._uplink_intervals[profile.device_profile.id] = intervals
+        return intervals
+
+    def get_uplink_intervals(self, device_profile_id):
+        """Get device profile uplink and status request intervals, request profile from api server if not known yet."""
+        intervals = self._uplink_intervals.get(device_profile_id)
+        if intervals is None:
+            intervals = self.set_uplink_intervals(self.get_chirp_device_profile(device_profile_id))
+        return intervals
+
+    def refresh_visibility_snapshot(self):
+        """Rebuild all application's devices visibility data from device list and known profile intervals."""
+        visibility_snapshot = {}
+        for device in self.get_chirp_app_devices():
+            uplink_interval, device_status_req_interval = self.get_uplink_intervals(device.device_profile_id)
+            visibility_snapshot[device.dev_eui] = {
+                "uplink_interval": uplink_interval,
+                "device_status_req_interval": device_status_req_interval,
+                "last_seen": self.get_last_seen(device.last_seen_at),
+            }
+        self._visibility = visibility_snapshot
+        _LOGGER.debug("Visibility snapshot refreshed for %s device(s)", len(visibility_snapshot))
 
     def get_device_visibility_info(self, dev_eui):
-        """Get device visibility data from api server: device last seen time stamp and expected uplink interval."""
+        """Get device visibility data: device last seen time stamp and expected uplink interval, from snapshot if available."""
+        visibility = self._visibility.get(dev_eui)
+        if visibility is not None:
+            return visibility
         device = self.get_chirp_device(dev_eui)
-        profile = self.get_chirp_device_profile(device.device.device_profile_id)
+        uplink_interval, device_status_req_interval = self.get_uplink_intervals(device.device.device_profile_id)
         visibility = {}
-        visibility["uplink_interval"] = profile.device_profile.uplink_interval
-        visibility["device_status_req_interval"] = profile.device_profile.device_status_req_interval
-        visibility["last_seen"] = device.last_seen_at.seconds+device.last_seen_at.nanos*1e-9 if str(device.last_seen_at) else 0
+        visibility["uplink_interval"] = uplink_interval
+        visibility["device_status_req_interval"] = device_status_req_interval
+        visibility["last_seen"] = self.get_last_seen(device.last_seen_at)
         return visibility
@@ -12,6 +12,11 @@ from zoneinfo import ZoneInfo
 
 import paho.mqtt.client as mqtt
 
+try:    # faster uplink payload decoding if available, accepts raw bytes
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 from .const import (
     BRIDGE,
     BRIDGE_ENTITY_NAME,
@@ -27,7 +32,23 @@ from .const import (
     CONF_MQTT_SERVER,
     CONF_MQTT_USER,
     CONF_MQTT_CHIRPSTACK_PREFIX,
+    CONF_OPTIONS_ASYNCIO_TRANSPORT,
+    CONF_OPTIONS_COMPACT_DISCOVERY,
+    CONF_OPTIONS_DEVICE_DISCOVERY,
+    CONF_OPTIONS_DISCOVERY_TEMPLATES,
+    CONF_OPTIONS_INCREMENTAL_RELOAD,
+    CONF_OPTIONS_MESSAGE_OVERFLOW_SIZE,
+    CONF_OPTIONS_MESSAGE_QUEUE_SIZE,
+    CONF_OPTIONS_MESSAGE_WORKERS,
+    CONF_OPTIONS_PUBLISH_RATE,
+    CONF_OPTIONS_PUBLISH_WINDOW,
+    CONF_OPTIONS_RELOAD_QUEUE_SIZE,
     CONF_OPTIONS_RESTORE_AGE,
+    CONF_OPTIONS_RESTORE_COMPLETION,
+    CONF_OPTIONS_REVALIDATE_RETRY,
+    CONF_OPTIONS_STALE_STARTUP,
+    CONF_OPTIONS_VALUES_STORE,
+    CONF_OPTIONS_VALUES_STORE_FLUSH,
     CONF_OPTIONS_START_DELAY,
     CONNECTIVITY_DEVICE_CLASS,
     ENTITY_CATEGORY_DIAGNOSTIC,
@@ -46,12 +67,41 @@ from .const import (
     DEFAULT_OPTIONS_ONLINE_PER_DEVICE,
     DEFAULT_OPTIONS_START_DELAY,
     DEFAULT_OPTIONS_RESTORE_AGE,
+    DEFAULT_OPTIONS_RELOAD_QUEUE_SIZE,
+    DEFAULT_OPTIONS_INCREMENTAL_RELOAD,
+    DEFAULT_OPTIONS_MESSAGE_OVERFLOW_SIZE,
+    DEFAULT_OPTIONS_MESSAGE_QUEUE_SIZE,
+    DEFAULT_OPTIONS_MESSAGE_WORKERS,
+    DEFAULT_OPTIONS_PUBLISH_RATE,
+    DEFAULT_OPTIONS_PUBLISH_WINDOW,
+    DEFAULT_OPTIONS_ASYNCIO_TRANSPORT,
+    DEFAULT_OPTIONS_COMPACT_DISCOVERY,
+    DEFAULT_OPTIONS_DEVICE_DISCOVERY,
+    DEFAULT_OPTIONS_DISCOVERY_TEMPLATES,
+    DEFAULT_OPTIONS_RESTORE_COMPLETION,
+    DEFAULT_OPTIONS_REVALIDATE_RETRY,
+    DEFAULT_OPTIONS_STALE_STARTUP,
+    DEFAULT_OPTIONS_VALUES_STORE,
+    DEFAULT_OPTIONS_VALUES_STORE_FLUSH,
 )
 INTEGRATION_BINARY_SENSOR = "binary_sensor"
 INTEGRATION_BUTTON = "button"
 INTEGRATION_SELECT = "select"
+CUR_SENTINEL_ID = "chirp_snapshot_end"   # device id of cur topic marking end of retained values snapshot
+VALUES_STORE_KEY = "chirp_values_store"  # dispatcher key for values store writes
 
+from .abbreviations import compact_discovery_config, dump_discovery_config
+from .cache import DeviceSetCache
+from .discovery import DEV_EUI_SLOT, DEV_NAME_SLOT, DiscoveryTemplate
+from .dispatcher import KeyedDispatcher
 from .grpc import ChirpGrpc
+from .pipeline import Pipeline
+from .registry import DeviceRecord
+from .publisher import PublishScheduler
+from .scheduler import DeadlineHeap, TimerService
+from .store import ValuesStore
+from .templates import add_template_paths, compile_fields_merge
+from .transport import AsyncioTransport
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -79,6 +129,11 @@ def generate_unique_id(configuration):
     unique_id = f"{hashlib.md5(u_id.encode('utf-8')).hexdigest()}"
     return unique_id
 
+def get_config_hash(config_struct):
+    """Get discovery config content hash ignoring publish time stamp."""
+    config_struct = {key: value for key, value in config_struct.items() if key != "time_stamp"}
+    return hashlib.md5(json.dumps(config_struct, sort_keys=True).encode("utf-8")).hexdigest()
+
 def convert_ret_val(ret_val):
     """Convert PAHO MQTT client api return codes to string, empty for 0(OK) return code."""
     if isinstance(ret_val, tuple):
@@ -96,7 +151,8 @@ class ChirpToHA:
     """ChirpStack LoRaWAN MQTT interface."""
 
     def __init__(
-        self, config, version, classes, grpc_client: ChirpGrpc, connectivity_check_only=False
+        self, config, version, classes, grpc_client: ChirpGrpc, connectivity_check_only=False, values_store_file=None,
+        device_set_file=None,
     ) -> None:
         """Open connection to HA MQTT server and initialize internal variables."""
         self._config = config
@@ -122,6 +178,8 @@ class ChirpToHA:
         self._client.on_connect = self.on_connect
         self._client.username_pw_set(self._user, self._pwd)
         self._client.connect(self._host, self._port)
+        self._connect_time = time.monotonic()
+        self._startup_duration = None
         self._origin = {
             "name": BRIDGE_VENDOR,
             "sw_version": self._version,
@@ -130,11 +188,20 @@ class ChirpToHA:
             f"{BRIDGE_VENDOR} {BRIDGE} {self._unique_id}"
         )
         self._ha_online_event = threading.Event()
-        self._cur_delay_event = threading.Event()
-        self._dev_check_event = threading.Event()
+        self._transport = None
+        self._asyncio_transport = self._config.get(CONF_OPTIONS_ASYNCIO_TRANSPORT, DEFAULT_OPTIONS_ASYNCIO_TRANSPORT)
+        self._timers = TimerService()
+        self._dev_check_lock = threading.Lock()
+        self._ha_online_timer = None
+        self._dev_check_timer = None
+        self._dev_check_time = None
+        self._next_resync = None
+        self._cur_timer = None
+        self._bridge_online_timer = None    # set while deferred bridge online phase is pending
+        self._offline_deadlines = DeadlineHeap()
         self._bridge_init_time = None
         self._cur_open_time = None
-        self._live_on = False
+        self._cur_sentinel = None    # sentinel token of open cur window, kept while window is extended
         self._expire_after = self._config.get(CONF_OPTIONS_EXPIRE_AFTER, DEFAULT_OPTIONS_EXPIRE_AFTER)
         self._bridge_state_received = False
         self._per_device_chk_interval = float(self._config.get(CONF_OPTIONS_ONLINE_PER_DEVICE, DEFAULT_OPTIONS_ONLINE_PER_DEVICE))
@@ -142,12 +209,57 @@ class ChirpToHA:
         self._cur_opened_count = 0
         self._discovery_delay = self._config.get(CONF_OPTIONS_START_DELAY, DEFAULT_OPTIONS_START_DELAY)
         self._cur_age = self._config.get(CONF_OPTIONS_RESTORE_AGE, DEFAULT_OPTIONS_RESTORE_AGE)
+        self._cur_completion = self._config.get(CONF_OPTIONS_RESTORE_COMPLETION, DEFAULT_OPTIONS_RESTORE_COMPLETION)
+        self._cur_lock = threading.Lock()
+        self._cur_pending = set()   # devices without retained values received yet
+        self._values_store = None
+        self._stored_values = {}
+        self._values_store_flush = self._config.get(CONF_OPTIONS_VALUES_STORE_FLUSH, DEFAULT_OPTIONS_VALUES_STORE_FLUSH)
+        if (
+            values_store_file
+            and not connectivity_check_only
+            and self._config.get(CONF_OPTIONS_VALUES_STORE, DEFAULT_OPTIONS_VALUES_STORE)
+        ):
+            try:
+                self._values_store = ValuesStore(values_store_file.format(self._unique_id))
+                self._stored_values = self._values_store.load()
+                self._timers.call_later(self._values_store_flush, self.flush_values_store)
+            except Exception as error:
+                _LOGGER.error("Values store open failed: %s", str(error))
+                self._values_store = None
+        self._revalidate_retry = self._config.get(CONF_OPTIONS_REVALIDATE_RETRY, DEFAULT_OPTIONS_REVALIDATE_RETRY)
+        self._device_set_cache = None
+        if (
+            device_set_file
+            and not connectivity_check_only
+            and self._config.get(CONF_OPTIONS_STALE_STARTUP, DEFAULT_OPTIONS_STALE_STARTUP)
+        ):
+            self._device_set_cache = DeviceSetCache(device_set_file.format(self._unique_id))
+        self._reload_queue_size = self._config.get(CONF_OPTIONS_RELOAD_QUEUE_SIZE, DEFAULT_OPTIONS_RELOAD_QUEUE_SIZE)
+        self._publisher = PublishScheduler(
+            self._config.get(CONF_OPTIONS_PUBLISH_RATE, DEFAULT_OPTIONS_PUBLISH_RATE),
+            self._config.get(CONF_OPTIONS_PUBLISH_WINDOW, DEFAULT_OPTIONS_PUBLISH_WINDOW),
+        )
+        if self._publisher.tracks_acks:
+            self._client.on_publish = self.on_publish
+        self._publish_rate = None
+        self._publish_throttled = None    # time spent waiting for publish rate/window limits, 0 if no limits set
+        self._reload_timings = {}
+        self._incremental_reload = self._config.get(CONF_OPTIONS_INCREMENTAL_RELOAD, DEFAULT_OPTIONS_INCREMENTAL_RELOAD)
+        self._device_discovery = self._config.get(CONF_OPTIONS_DEVICE_DISCOVERY, DEFAULT_OPTIONS_DEVICE_DISCOVERY)
+        self._device_components = {}    # retained device-based discovery topic -> {object id: platform}
+        self._compact_discovery = self._config.get(CONF_OPTIONS_COMPACT_DISCOVERY, DEFAULT_OPTIONS_COMPACT_DISCOVERY)
+        self._discovery_bytes = 0
+        self._use_discovery_templates = self._config.get(CONF_OPTIONS_DISCOVERY_TEMPLATES, DEFAULT_OPTIONS_DISCOVERY_TEMPLATES)
+        self._discovery_templates = {}  # profile id -> {entity: template, None: device-based template}, False if not shareable
         self._devices_config_topics = set()
         self._old_devices_config_topics = set()
-        self._messages_to_restore_values = []
         self._top_level_msg_names = None
-        self._values_cache = {}
+        self._merge_values = compile_fields_merge(None)
+        self._devices = {}  # device registry: dev_eui -> DeviceRecord
         self._config_topics_published = 0
+        self._config_topics_hashes = {}
+        self._config_topics_unchanged = 0
         self._bridge_config_topics_published = -1
         self._initialize_topic = f"{self._chirpstack_prefix}application/{self._application_id}/status"
         self._bridge_state_topic = f"{self._chirpstack_prefix}application/{self._application_id}/bridge/status"
@@ -157,12 +269,39 @@ class ChirpToHA:
         )
         self._ha_status = f"{self._discovery_prefix}/status"
         self._sub_cur_topic = f"{self._chirpstack_prefix}application/{self._application_id}/device/+/event/cur"
+        self._device_event_topic = f"{self._chirpstack_prefix}application/{self._application_id}/device/{{}}/event/{{}}"
+        self._device_topic_base = f"{self._chirpstack_prefix}application/{self._application_id}/device/{{}}"
+        self._topic_handlers = {
+            self._bridge_state_topic: self.on_bridge_state_message,
+            self._bridge_restart_topic: self.on_bridge_restart_message,
+            self._bridge_live_topic: self.on_bridge_live_message,
+            self._ha_status: self.on_ha_status_message,
+            self._initialize_topic: self.on_initialize_message,
+        }
+        self._device_topic_pattern = re.compile(
+            f"{re.escape(self._chirpstack_prefix)}application/(?P<application>[^/]+)/device/(?P<dev_eui>[^/]+)/event/(?P<event>[^/]+)$"
+        )
+        self._config_topic_pattern = re.compile(
+            f"{re.escape(self._discovery_prefix)}/(?P<integration>[^/]+)/(?P<dev_eui>[^/]+)/(?P<entity>[^/]+)/config$"
+        )
+        self._device_config_topic_pattern = re.compile(
+            f"{re.escape(self._discovery_prefix)}/(?P<integration>device)/(?P<dev_eui>[^/]+)/config$"
+        )
+        self._event_handlers = {     # device event type handlers, other events (join, status, ack, ...) are ignored
+            "up": self.on_up_message,
+            "cur": self.on_cur_message,
+        }
         _LOGGER.info(
             "Connected to MQTT at %s:%s as %s",
             self._config.get(CONF_MQTT_SERVER),
             self._config.get(CONF_MQTT_PORT),
             self._config.get(CONF_MQTT_USER),
         )
+        self._dispatcher = KeyedDispatcher(
+            0 if connectivity_check_only else self._config.get(CONF_OPTIONS_MESSAGE_WORKERS, DEFAULT_OPTIONS_MESSAGE_WORKERS),
+            self._config.get(CONF_OPTIONS_MESSAGE_QUEUE_SIZE, DEFAULT_OPTIONS_MESSAGE_QUEUE_SIZE),
+            self._config.get(CONF_OPTIONS_MESSAGE_OVERFLOW_SIZE, DEFAULT_OPTIONS_MESSAGE_OVERFLOW_SIZE),
+        )
         self._client.on_message = self.on_message
 
         self.subscribe(self._initialize_topic)
@@ -176,10 +315,6 @@ class ChirpToHA:
         ]
 
         if not connectivity_check_only:
-            self._wait_for_ha_online = threading.Thread(target=self.ha_online_waiter)
-            self._wait_for_dev_check = threading.Thread(target=self.dev_check_waiter)
-            self._wait_for_cur = threading.Thread(target=self.cur_waiter)
-
             self.publish( self._initialize_topic, "initialize" )
             _LOGGER.info(
                 "Bridge setup 'initialize' message published",
@@ -226,29 +361,65 @@ class ChirpToHA:
         )
         return ret_val
 
-    def ha_online_waiter(self): # to start bridge if homeassistant/status message is not received within discovery timeout
-        """Thread app to send HA online message after specified time."""
-        if not self._ha_online_event.wait(self._discovery_delay+0.1):
+    def publish_discovery(self, topic, message):
+        """Publish retained discovery message paced by publish scheduler, called on worker thread only."""
+        return self._publisher.publish(self.publish, topic, message, retain=True)
+
+    def on_publish(self, client, userdata, mid, reason_code, properties):
+        """MQTT api message sent callback: release publish scheduler in-flight window."""
+        self._publisher.on_publish(mid)
+
+    def start_transport(self, loop):
+        """Start MQTT network processing and bridge timers on event loop in asyncio transport mode, return False if loop_forever thread is needed."""
+        if not self._asyncio_transport:
+            self._timers.start()
+            return False
+        self._timers.start(loop)
+        self._transport = AsyncioTransport(loop, self._client)
+        self._transport.start()
+        self._dispatcher.on_overflow = self._transport.pause_reading   # backpressure as event loop is never blocked by dispatch
+        return True
+
+    def ha_online_timeout(self): # to start bridge if homeassistant/status message is not received within discovery timeout
+        """Timer callback to send HA online message after specified time."""
+        if not self._ha_online_event.is_set():
             self._ha_online_event.set()
             self.publish( self._initialize_topic, "configure" )
             _LOGGER.debug("%ss timeout expired, but no HA online message received, bridge setup 'configure' message published",
                           self._discovery_delay)
 
-    def dev_check_waiter(self): # to periodically start device status update
-        """Thread app to send refresh device live status message after specified time in infinite loop."""
-        while not self._dev_check_event.is_set():
-            if not self._dev_check_event.wait(self._per_device_chk_interval*60+0.1):
-                self.publish( self._bridge_live_topic, "start" )
-
-    def cur_waiter(self): # close time window for cur message processing
-        """Thread app to close cur window after specified time, prepare thread for next time run."""
-        if not self._cur_delay_event.wait(self._cur_age+0.1):
-            time_delta = self._cur_open_time + self._cur_age - time.time()
-            while time_delta > 0 and not self._cur_delay_event.wait(time_delta):
-                time_delta = self._cur_open_time + self._cur_age - time.time()
-            _LOGGER.debug("Time to stop cur message watch")
-            self.disable_cur()
-            self._wait_for_cur = threading.Thread(target=self.cur_waiter)
+    def schedule_dev_check(self, reschedule=False):
+        """Arm device check timer for earliest offline deadline or periodic resync, rearm only for earlier time if reschedule."""
+        next_deadline = self._offline_deadlines.next_deadline()
+        wake_time = self._next_resync if next_deadline is None else min(self._next_resync, next_deadline)
+        with self._dev_check_lock:
+            if reschedule and self._dev_check_time is not None and self._dev_check_time <= wake_time:
+                return
+            if self._dev_check_timer:
+                self._dev_check_timer.cancel()
+            self._dev_check_time = wake_time
+            self._dev_check_timer = self._timers.call_later(max(wake_time - time.time(), 0) + 0.1, self.dev_check)
+
+    def dev_check(self): # to trigger device offline deadlines and periodic device status resync
+        """Timer callback to send expired device deadlines and periodic status resync requests, rearms itself."""
+        offline_devices = self._offline_deadlines.pop_due(time.time())
+        if offline_devices:
+            self.publish( self._bridge_live_topic, json.dumps({"offline": offline_devices}) )
+        if time.time() >= self._next_resync:
+            self._next_resync = time.time() + self._per_device_chk_interval*60
+            self.publish( self._bridge_live_topic, "start" )
+        self.schedule_dev_check()
+
+    def cur_timeout(self): # close time window for cur message processing
+        """Timer callback to close cur window after specified time, rearmed if window was extended."""
+        if not self._cur_opened_count:
+            return
+        time_delta = self._cur_open_time + self._cur_age - time.time()
+        if time_delta > 0:
+            self._cur_timer = self._timers.call_later(time_delta, self.cur_timeout)
+            return
+        _LOGGER.debug("Time to stop cur message watch")
+        self.disable_cur()
 
     def start_bridge(self):
         """Start Lora bridge registration within HA MQTT."""
@@ -379,14 +550,20 @@ class ChirpToHA:
             self._bridge_config_topics_published,
         )
 
-    def reload_devices(self):
+    def reload_devices(self, incremental=False):
+        """Reload devices from api server and publish discovery messages, unchanged devices are not refetched in incremental mode."""
         self._bridge_init_time = time.time()
         _LOGGER.info(
             "Bridge initialization time stamp %s",
             self._bridge_init_time,
         )
+        self._grpc_client.check_deferred_application_id()
+        self._publisher.begin()
 
-        device_sensors = self._grpc_client.get_current_device_entities()
+        pipeline = Pipeline(self._reload_queue_size)
+        for stage_name, stage in self._grpc_client.get_device_entities_stages(incremental):
+            pipeline.add_stage(stage_name, stage)
+        pipeline.add_stage("config", self.get_devices_conf_data)
 
         self._dev_sensor_count = 0
         self._dev_count = 0
@@ -394,33 +571,41 @@ class ChirpToHA:
         self._devices_config_topics = set()
         devices_config_topics = set()
         self._config_topics_published = 0
-        self._values_cache = {}
-        self._messages_to_restore_values = []
+        self._config_topics_unchanged = 0
+        self._discovery_bytes = 0
+        self._discovery_templates = {}
+        if self._values_store:    # values in memory are more recent than stored ones
+            self._stored_values.update({dev_eui: record.values for dev_eui, record in self._devices.items() if record.values})
+        devices = {}    # new registry, swapped in at reload end: uplinks during reload still find their device
+        cur_pending = set()
         value_templates = []
+        merge_functions = {}    # device value templates -> compiled payload fields merge
+        restore_count = 0
+        device_set_devices = {}
+        device_set_configs = {}
 
-        for device in device_sensors:
+        for device, sensors_conf_data in pipeline.run("publish"):
             previous_values = device["dev_conf"].get("prev_value")
             dev_eui = device["dev_conf"]["dev_eui"]
-            self._values_cache[dev_eui] = {}
-            for sensor in device["entities"]:
-                sensor_entity_conf_data = self.get_conf_data(
-                    sensor,
-                    device["entities"][sensor],
-                    device["device"],
-                    device["dev_conf"],
+            record = device["record"]
+            devices[dev_eui] = record
+            cur_pending.add(dev_eui)
+            device_templates = []
+            if self._device_discovery and sensors_conf_data:
+                self.publish_discovery_config(
+                    dev_eui, self.get_device_discovery(device, sensors_conf_data), devices_config_topics, device_set_configs
                 )
+            for sensor, sensor_entity_conf_data in sensors_conf_data:
                 for conf_key in sensor_entity_conf_data["discovery_config_struct"].keys():
                     if conf_key.endswith("_template"):
-                        value_templates.append(sensor_entity_conf_data["discovery_config_struct"][conf_key])
-                devices_config_topics.add(sensor_entity_conf_data["discovery_topic"])
-                self.publish(
-                    sensor_entity_conf_data["discovery_topic"],
-                    sensor_entity_conf_data["discovery_config"],
-                    retain=True,
-                )
-                _LOGGER.info(
-                    f"Discovery message published: device {dev_eui} sensor '{sensor_entity_conf_data["discovery_topic"].split("/")[1]}'"
-                )
+                        device_templates.append(sensor_entity_conf_data["discovery_config_struct"][conf_key])
+                if not self._device_discovery:
+                    self.publish_discovery_config(dev_eui, sensor_entity_conf_data, devices_config_topics, device_set_configs)
+                if not self._dev_sensor_count:
+                    _LOGGER.info(
+                        "First discovery message published %.3fs after reload start",
+                        time.time() - self._bridge_init_time,
+                    )
                 for sens_id in previous_values:
                     if (
                         sens_id
@@ -428,88 +613,383 @@ class ChirpToHA:
                     ):
                         topic_for_value = sensor_entity_conf_data["status_topic"]
                         payload_for_value = f'{{"{sens_id}":{str(previous_values[sens_id])},"time_stamp":{time.time()}}}'
-                        self._messages_to_restore_values.append(
+                        record.restore_messages.append(
                             (topic_for_value, payload_for_value)
                         )
+                        restore_count += 1
                 self._dev_sensor_count += 1
+            device_templates = tuple(dict.fromkeys(device_templates))
+            if device_templates not in merge_functions:
+                fields_tree = {}
+                for value_template in device_templates:
+                    add_template_paths(fields_tree, value_template)
+                merge_functions[device_templates] = compile_fields_merge(fields_tree)
+            record.merge_values = merge_functions[device_templates]
+            value_templates.extend(device_templates)
             self._dev_count += 1
+            device_set_devices[dev_eui] = len(sensors_conf_data)
 
+        for dev_eui, record in devices.items():
+            if dev_eui in self._devices:
+                record.status = self._devices[dev_eui].status
+        self._devices = devices
+        self._cur_pending = cur_pending
         self._devices_config_topics = devices_config_topics
 
         self._top_level_msg_names = {}
-        for value_template in value_templates:
-            for msg_name in re.findall(r"(value_json\..{1,}?)\ ", value_template):
-                names = re.split(r"\.", msg_name[11:])
-                level = self._top_level_msg_names
-                for name in names:
-                    name_t = re.split(r"\[", name)
-                    if len(name_t) == 1:
-                        if name not in level:
-                            level[name] = {}
-                        level = level[name]
-                    else:
-                        if name_t[0] not in level:
-                            level[name_t[0]] = [{}]
-                        level = level[name_t[0]][0]
+        for value_template in dict.fromkeys(value_templates):
+            add_template_paths(self._top_level_msg_names, value_template)
         _LOGGER.debug("Top level names %s", self._top_level_msg_names)
+        self._merge_values = compile_fields_merge(self._top_level_msg_names)
+        if self._device_set_cache:
+            self._device_set_cache.save(
+                {"devices": device_set_devices, "configs": device_set_configs, "fields": self._top_level_msg_names}
+            )
 
         _LOGGER.info(
-            "%s value(s) restore request(s) queued", len(self._messages_to_restore_values)
+            "%s value(s) restore request(s) queued", restore_count
         )
         _LOGGER.info(
             "Devices reloaded, %s device{s) and %s sensor(s) found",
             self._dev_count,
             self._dev_sensor_count,
         )
+        _LOGGER.info(
+            "%s unchanged discovery message(s) not republished", self._config_topics_unchanged
+        )
+        _LOGGER.info(
+            "Devices discovery payloads size %s byte(s), %s byte(s) per device",
+            self._discovery_bytes,
+            self._discovery_bytes // self._dev_count if self._dev_count else 0,
+        )
+        self._reload_timings = pipeline.timings
+        self._publish_rate = self._publisher.rate()
+        self._publish_throttled = round(self._publisher.throttled, 3)
+        _LOGGER.info("Discovery publishing: %s", self._publisher.get_publish_info())
+        _LOGGER.info(
+            "Devices reload took %.3fs, stage busy time/items: %s",
+            time.time() - self._bridge_init_time,
+            pipeline.get_timings_info(),
+        )
+
+    def publish_discovery_config(self, dev_eui, conf_data, devices_config_topics, device_set_configs):
+        """Publish discovery message if its content differs from retained one."""
+        discovery_topic = conf_data["discovery_topic"]
+        devices_config_topics.add(discovery_topic)
+        config_hash = conf_data["config_hash"]
+        self._discovery_bytes += len(conf_data["discovery_config"])
+        if self._device_set_cache:
+            device_set_configs[discovery_topic] = [conf_data["discovery_config"], config_hash]
+        if self._config_topics_hashes.get(discovery_topic) == config_hash:
+            self._config_topics_unchanged += 1
+            self._config_topics_published += 1   # retained config is up to date, no echo expected
+            _LOGGER.debug(
+                "Discovery message unchanged, not published: device %s topic %s", dev_eui, discovery_topic
+            )
+        else:
+            self.publish_discovery(
+                discovery_topic,
+                conf_data["discovery_config"],
+            )
+            self._config_topics_hashes[discovery_topic] = config_hash
+            _LOGGER.info(
+                f"Discovery message published: device {dev_eui} sensor '{discovery_topic.split('/')[1]}'"
+            )
+
+    def get_device_conf_data(self, sensors_conf_data):
+        """Merge device entities discovery payloads into single device-based discovery payload with components map."""
+        discovery_config = {}
+        components = {}
+        for sensor, sensor_entity_conf_data in sensors_conf_data:
+            component = dict(sensor_entity_conf_data["discovery_config_struct"])
+            if not discovery_config:
+                discovery_config["device"] = component["device"]
+                discovery_config["origin"] = component["origin"]
+                if "availability" in component:
+                    discovery_config["availability"] = component["availability"]
+            for key in ("device", "origin", "time_stamp"):
+                component.pop(key, None)
+            if component.get("availability") == discovery_config.get("availability"):
+                component.pop("availability", None)
+            component["platform"] = sensor_entity_conf_data["integration"]
+            components[sensor_entity_conf_data["object_id"]] = component
+        discovery_topic = f"{self._discovery_prefix}/device/{sensor_entity_conf_data['dev_eui']}/config"
+        for object_id, platform in self._device_components.get(discovery_topic, {}).items():
+            if object_id not in components:     # removed from device by platform only component
+                components[object_id] = {"platform": platform}
+        discovery_config["components"] = components
+        if self._bridge_init_time:
+            discovery_config["time_stamp"] = self._bridge_init_time
+        payload_struct, payload = self.get_discovery_payload(discovery_config, sensor_entity_conf_data["dev_eui"])
+        return {
+            "discovery_config_struct": discovery_config,
+            "discovery_payload_struct": payload_struct,
+            "discovery_config": payload,
+            "config_hash": get_config_hash(payload_struct),
+            "discovery_topic": discovery_topic,
+        }
+
+    def get_device_discovery(self, device, sensors_conf_data):
+        """Get device-based discovery data from profile template, merge device entities payloads if template is not usable."""
+        templates = self.get_profile_templates(device)
+        if templates and None in templates:
+            dev_conf = device["dev_conf"]
+            conf_data = templates[None].render(
+                DiscoveryTemplate.slot_values(dev_conf["dev_eui"], dev_conf["dev_name"] or "0x" + dev_conf["dev_eui"])
+            )
+            if not set(self._device_components.get(conf_data["discovery_topic"], ())) - set(
+                templates[None].conf_data["discovery_config_struct"]["components"]
+            ):  # no removed components to be sent
+                return conf_data
+        return self.get_device_conf_data(sensors_conf_data)
+
+    def get_discovery_payload(self, discovery_config, dev_eui):
+        """Get published discovery payload struct and its serialization, abbreviated in compact mode."""
+        if self._compact_discovery:
+            discovery_config = compact_discovery_config(discovery_config, self._device_topic_base.format(dev_eui))
+        return discovery_config, dump_discovery_config(discovery_config, self._compact_discovery)
+
+    def new_device_record(self, dev_eui):
+        """Create device record with precomputed device topics and availability."""
+        return DeviceRecord(
+            dev_eui, self._device_topic_base.format(dev_eui), self._availability_element, self._per_device_online, self._merge_values
+        )
+
+    def get_profile_templates(self, device):
+        """Get discovery templates of device profile entities, prepared on first profile device; None if device payloads can not be shared."""
+        dev_conf = device["dev_conf"]
+        profile_id = dev_conf.get("profile_id")
+        dev_eui = dev_conf["dev_eui"]
+        if (
+            not self._use_discovery_templates
+            or not profile_id
+            or dev_eui != to_lower_case_no_blanks(dev_eui)
+            or json.dumps(dev_eui)[1:-1] != dev_eui
+        ):
+            return None
+        templates = self._discovery_templates.get(profile_id)
+        if templates is None:
+            templates = False
+            if not any(   # per device overrides in profile codec
+                key.startswith("dev_eui")
+                for conf in [device["device"]] + [entity["entity_conf"] for entity in device["entities"].values()]
+                for key in conf
+            ):
+                slot_conf = dict(dev_conf, dev_eui=DEV_EUI_SLOT, dev_name=DEV_NAME_SLOT)
+                entities_conf_data = [
+                    (sensor, self.get_conf_data(sensor, device["entities"][sensor], device["device"], slot_conf))
+                    for sensor in device["entities"]
+                ]
+                templates = {
+                    sensor: DiscoveryTemplate(conf_data, self._compact_discovery) for sensor, conf_data in entities_conf_data
+                }
+                if self._device_discovery and entities_conf_data:
+                    templates[None] = DiscoveryTemplate(self.get_device_conf_data(entities_conf_data), self._compact_discovery)
+            self._discovery_templates[profile_id] = templates
+            _LOGGER.debug("Profile %s discovery templates prepared: %s", profile_id, bool(templates))
+        return templates
+
+    def get_devices_conf_data(self, devices):
+        """Yield devices with discovery payloads prepared for every device sensor, rendered from profile templates if possible."""
+        for device in devices:
+            device["record"] = self.new_device_record(device["dev_conf"]["dev_eui"])
+            templates = self.get_profile_templates(device)
+            if templates:
+                dev_conf = device["dev_conf"]
+                values = DiscoveryTemplate.slot_values(dev_conf["dev_eui"], dev_conf["dev_name"] or "0x" + dev_conf["dev_eui"])
+                yield device, [(sensor, templates[sensor].render(values)) for sensor in device["entities"]]
+                continue
+            yield device, [
+                (
+                    sensor,
+                    self.get_conf_data(
+                        sensor,
+                        device["entities"][sensor],
+                        device["device"],
+                        device["dev_conf"],
+                        device["record"],
+                    ),
+                )
+                for sensor in device["entities"]
+            ]
 
     def enable_cur(self):
         """Enable cur window for restoring previous device values or updating live status."""
         self._cur_open_time = time.time()
-        if not self._cur_opened_count:
+        with self._cur_lock:
+            opened = not self._cur_opened_count
+            self._cur_opened_count += 1
+        if opened:
             ret_val = self.subscribe(self._sub_cur_topic)
             _LOGGER.info(
                 "Subscribed to retained values topic%s at %s",
                 convert_ret_val(ret_val),
                 self._cur_open_time,
             )
-            self._wait_for_cur.start()
-            time.sleep(0)
-        self._cur_opened_count += 1
+            self._cur_timer = self._timers.call_later(self._cur_age+0.1, self.cur_timeout)
+            if self._cur_completion:    # delivered after retained values of subscription
+                self._cur_sentinel = self._cur_open_time
+                self.publish(
+                    self._device_event_topic.format(CUR_SENTINEL_ID, "cur"), json.dumps({"sentinel": self._cur_sentinel})
+                )
 
-    def disable_cur(self):
-        """Disable cur window."""
-        self._cur_opened_count = 0
-        if not self._cur_opened_count:
-            self._live_on = False
-            self.unsubscribe(self._sub_cur_topic)
-            _LOGGER.info(
-                "Unsubscribed from retained values topic"
-            )
-            _LOGGER.debug(
-                "Not processed retained devices %s, processing age %s(s)",
-                len([dev_id for dev_id, val in self._values_cache.items() if val == {}]),
-                time.time() - self._cur_open_time,
+    def disable_cur(self, reason="age limit"):
+        """Disable cur window, no action if window is already closed."""
+        with self._cur_lock:
+            if not self._cur_opened_count:
+                return
+            self._cur_opened_count = 0
+        if self._cur_timer:
+            self._cur_timer.cancel()
+        self.unsubscribe(self._sub_cur_topic)
+        _LOGGER.info(
+            "Unsubscribed from retained values topic, %s", reason
+        )
+        _LOGGER.debug(
+            "Not processed retained devices %s, processing age %s(s)",
+            len(self._cur_pending),
+            time.time() - self._cur_open_time,
+        )
+
+    def publish_bridge_state(self):
+        """Publish bridge online state with configured log level."""
+        self.publish(
+            self._bridge_state_topic, f'{{"state": "online", "log_level": "{self._config.get(CONF_OPTIONS_LOG_LEVEL, DEFAULT_OPTIONS_LOG_LEVEL)}"}}', retain=True
+        )
+        _LOGGER.info(
+            "Bridge state turned on, log level %s",
+            self._config.get(CONF_OPTIONS_LOG_LEVEL, DEFAULT_OPTIONS_LOG_LEVEL),
+        )
+
+    def apply_device_set(self):
+        """Set devices values cache and payload fields merge from cached device set."""
+        device_set = self._device_set_cache.device_set
+        self._top_level_msg_names = device_set["fields"]
+        self._merge_values = compile_fields_merge(self._top_level_msg_names)
+        devices = {}
+        for dev_eui in device_set["devices"]:
+            record = self.new_device_record(dev_eui)
+            if dev_eui in self._devices:
+                record.status = self._devices[dev_eui].status
+            devices[dev_eui] = record
+        self._devices = devices
+        self._cur_pending = set(devices)
+        self._dev_count = len(device_set["devices"])
+        self._dev_sensor_count = sum(device_set["devices"].values())
+
+    def publish_device_set(self):
+        """Publish discovery and bridge availability of cached device set ahead of ChirpStack server revalidation."""
+        self.apply_device_set()
+        for topic, (payload, config_hash) in self._device_set_cache.device_set["configs"].items():
+            self.publish_discovery(topic, payload)
+            self._config_topics_hashes[topic] = config_hash
+        self.publish_bridge_state()
+        _LOGGER.info(
+            "Cached device set published, %s device(s) and %s sensor(s)", self._dev_count, self._dev_sensor_count
+        )
+
+    def revalidate_devices(self, incremental=False):
+        """Reload devices from ChirpStack server, keep cached device set and retry later if server is not available."""
+        try:
+            self.reload_devices(incremental=incremental)
+        except Exception as error:
+            if not (self._device_set_cache and self._device_set_cache.device_set):
+                raise
+            _LOGGER.warning(
+                "Devices revalidation failed: %s, cached device set kept, retry in %ss", str(error), self._revalidate_retry
             )
+            self.apply_device_set()
+            self._timers.call_later(self._revalidate_retry, self.dispatch, None, self.revalidate_devices, incremental)
+
+    def restore_stored_values(self):
+        """Restore device values from local store without waiting for retained values, return number of restored devices."""
+        if not self._values_store:
+            return 0
+        restored = 0
+        for dev_eui, payload_struct in list(self._stored_values.items()):
+            record = self._devices.get(dev_eui)
+            if record is None:
+                self._values_store.delete(dev_eui)
+                del self._stored_values[dev_eui]
+            elif record.values == {}:
+                self.publish_value_cache_record(record, "up", payload_struct)
+                restored += 1
+        _LOGGER.info("Values of %s device(s) restored from local store, %s device(s) left for retained values", restored, len(self._cur_pending))
+        return restored
+
+    def flush_values_store(self):
+        """Timer callback to pass buffered values store updates to message worker, rearms itself."""
+        self.dispatch(VALUES_STORE_KEY, self._values_store.flush)
+        self._timers.call_later(self._values_store_flush, self.flush_values_store)
+
+    def on_cur_sentinel(self, payload):
+        """Close cur window once retained values received before sentinel are processed."""
+        if json.loads(payload).get("sentinel") == self._cur_sentinel:
+            self.disable_cur("retained values snapshot end received")
 
     def get_device_status(self, dev_eui):
-        """Check device live status based on ChirpStack server information via gRPC interface."""
-        visibility = self._grpc_client.get_device_visibility_info(dev_eui)
-        if visibility["last_seen"] and visibility["uplink_interval"]:
-            status = "online" if time.time()-visibility["last_seen"]<=visibility["uplink_interval"] else "offline"
+        """Check device live status based on scheduled offline deadline or ChirpStack server information via gRPC interface."""
+        deadline = self._offline_deadlines.get(dev_eui)
+        if deadline is not None:
+            status = "online" if time.time() < deadline else "offline"
+            visibility = {"deadline": deadline}
         else:
-            status = "offline"
+            visibility = self._grpc_client.get_device_visibility_info(dev_eui)
+            if visibility["last_seen"] and visibility["uplink_interval"]:
+                status = "online" if time.time()-visibility["last_seen"]<=visibility["uplink_interval"] else "offline"
+            else:
+                status = "offline"
         _LOGGER.debug(
             "Device %s status now is %s (live status: %s, current time stamp %s)", dev_eui, status, visibility, time.time()
         )
         return status
 
+    def schedule_device_offline(self, dev_eui, deadline):
+        """Schedule device offline deadline, earlier deadline than already scheduled is ignored."""
+        scheduled = self._offline_deadlines.get(dev_eui)
+        if scheduled is None or scheduled < deadline:
+            if self._offline_deadlines.schedule(dev_eui, deadline) and self._next_resync is not None:
+                self.schedule_dev_check(reschedule=True)
+
+    def device_seen(self, record):
+        """Move device offline deadline after uplink received."""
+        visibility = self._grpc_client.get_device_visibility_info(record.dev_eui)
+        if visibility["uplink_interval"]:
+            self.schedule_device_offline(record.dev_eui, time.time() + visibility["uplink_interval"])
+        record.status = self.get_device_status(record.dev_eui)
+
+    def publish_device_status(self, dev_eui, status=None):
+        """Publish device cur message if device status changed since last publish."""
+        record = self._devices.get(dev_eui)
+        if record is None:
+            return
+        status = status if status else self.get_device_status(dev_eui)
+        if record.status != status:
+            record.status = status
+            self.publish_value_cache_record(record, "cur", {}, retain=True, status=status)
+            _LOGGER.info("Device %s status changed to %s", dev_eui, status)
+
+    def resync_devices_status(self):
+        """Rebuild offline deadlines from device visibility snapshot and publish changed device statuses."""
+        try:
+            self._grpc_client.refresh_visibility_snapshot()
+            for dev_eui in list(self._devices):
+                visibility = self._grpc_client.get_device_visibility_info(dev_eui)
+                if visibility["last_seen"] and visibility["last_seen"] + visibility["uplink_interval"] > time.time():
+                    self.schedule_device_offline(dev_eui, visibility["last_seen"] + visibility["uplink_interval"])
+                self.publish_device_status(dev_eui)
+        except Exception as error:
+            _LOGGER.error("Device status resync failed: %s", str(error))
+
     def clean_up_disappeared(self):
         """Remove retained config messages from mqtt server if not in recent device list."""
         if self._old_devices_config_topics:
             for config_topic in (
                 self._old_devices_config_topics - self._devices_config_topics
             ):
-                self.publish(config_topic, None, retain=True)
+                self.publish_discovery(config_topic, None)
+                self._config_topics_hashes.pop(config_topic, None)
+                self._device_components.pop(config_topic, None)
                 _LOGGER.info(
                     "Removing retained topic %s", config_topic
                 )
@@ -517,132 +997,32 @@ class ChirpToHA:
         self._config_topics_published = 0
 
     def on_message(self, client, userdata, message):
-        """Process subscribed messages."""
+        """Pass subscribed message to worker: device messages by dev_eui, bridge/config messages to single worker."""
+        route = self._device_topic_pattern.match(message.topic)
+        if route and route["dev_eui"] == CUR_SENTINEL_ID:
+            self._dispatcher.dispatch_barrier(self.on_cur_sentinel, message.payload, block=not self._asyncio_transport)
+            return
+        if route:
+            self.dispatch(route["dev_eui"], self.process_message, message, route)
+        else:   # reload on bridge worker may wait for publish acknowledgements processed by network thread
+            self._dispatcher.dispatch(None, self.process_message, message, route, block=False)
+
+    def dispatch(self, key, task, *args):
+        """Pass task to message worker, event loop is never blocked by full worker queue in asyncio transport mode."""
+        self._dispatcher.dispatch(key, task, *args, block=not self._asyncio_transport)
+
+    def process_message(self, message, route):
+        """Process subscribed message on worker thread."""
         self._last_update = datetime.datetime.now(UTC_TIMEZONE)
         payload = message.payload.decode("utf-8")
         _LOGGER.detail("MQTT message received: topic %s, payload %s, retain=%s", message.topic, payload, message.retain)
-        if message.topic == self._bridge_state_topic:
-            self._bridge_state_received = True
-            _LOGGER.info("Bridge state message received")
-            try:
-                logging.getLogger().setLevel(json.loads(payload).get("log_level").upper())
-            except Exception as error:
-                _LOGGER.error("Bridge state message processing failed: %s", str(error))
-        elif message.topic == self._bridge_restart_topic:
-            _LOGGER.info(
-                "Bridge restart requested"
-            )
-            self._bridge_config_topics_published = 0    # enables value restoration
-            self.reload_devices()
-        elif message.topic == self._bridge_live_topic:
-            _LOGGER.debug("Bridge device live status update requested")
-            if payload == "start":
-                self._live_on = True
-                self.enable_cur()
-        elif message.topic == self._ha_status:
-            if payload == "online":
-                self._ha_online_event.set()
-                self.publish( self._initialize_topic, "configure" )
-                _LOGGER.info(
-                    "HA online, continuing configuration"
-                )
-            elif payload == "offline":
-                _LOGGER.info(
-                    "HA offline message received",
-                )
-
-        elif message.topic == self._initialize_topic:
-            _LOGGER.info(
-                "Bridge setup '%s' message received",
-                payload
-            )
-            if payload == "initialize":
-                self._wait_for_ha_online.start()
-                if self._per_device_online:
-                    self._wait_for_dev_check.start()
-                    _LOGGER.info("Periodic device check task started for %s minute(s) interval", self._per_device_chk_interval)
-            else: # configure
-                self.subscribe(self._bridge_state_topic)
-                self.subscribe(self._bridge_restart_topic)
-                self.subscribe(
-                    f"{self._chirpstack_prefix}application/{self._application_id}/device/+/event/up"
-                )
-                self.subscribe(f"{self._discovery_prefix}/+/+/+/config")
-                self.start_bridge()
-                self.reload_devices()
+        topic_handler = self._topic_handlers.get(message.topic)
+        if topic_handler:
+            topic_handler(payload)
         else:
-            subtopics = message.topic.split("/")
-            payload_struct = json.loads(payload) if len(payload) > 2 else None
-            if payload_struct:
-                time_stamp = payload_struct.get("time_stamp")
-                _LOGGER.detail(f"Processing message with time stamp {time_stamp} for topic {message.topic} and payload {payload_struct}")
-
-                if subtopics[-1] == "config":
-                    if payload_struct.get("device"):
-                        if (
-                            "via_device" in payload_struct["device"]
-                            and payload_struct["device"]["via_device"]
-                            == self._bridge_indentifier
-                        ):
-                            _LOGGER.info(f"Registration message with time stamp {time_stamp} received for device {subtopics[2]} sensor {subtopics[1]}")
-                            self._old_devices_config_topics.add(message.topic)
-                            if (
-                                time_stamp and float(time_stamp) >= self._bridge_init_time
-                            ):
-                                self._config_topics_published += 1
-                        else:
-                            self._bridge_config_topics_published -= 1
-                elif subtopics[-1] == "cur":
-                    dev_eui = subtopics[-3]
-                    _LOGGER.info("Cached values received for device %s", dev_eui)
-                    _LOGGER.debug(
-                        "Cached values payload time %s, bridge time %s, cached object %s, value cache %s",
-                        time_stamp,
-                        self._bridge_init_time,
-                        payload_struct.get("object"),
-                        self._values_cache,
-                    )
-                    if (
-                        time_stamp and float(time_stamp) < self._bridge_init_time
-                    ):
-                        if dev_eui not in self._values_cache:
-                            self.publish(message.topic, None, retain=True)
-                            _LOGGER.debug(
-                                "Value cache removal topic %s published",
-                                message.topic,
-                            )
-                        elif self._values_cache[dev_eui] == {} and time_stamp < self._cur_open_time:
-                            ret_val = self.publish_value_cache_record(
-                                subtopics, "up", dev_eui, payload_struct
-                            )
-                    if self._live_on and time_stamp < self._cur_open_time:
-                        self.publish_value_cache_record(
-                                subtopics, "cur", dev_eui, payload_struct
-                            )
-                    cache_not_retrieved = len(
-                        [dev_id for dev_id, val in self._values_cache.items() if val == {}]
-                    )
-                    _LOGGER.debug("%s device(s) cached values not processed", cache_not_retrieved)
-                elif subtopics[-1] == "up":
-                    dev_eui = subtopics[-3]
-                    if (
-                        not time_stamp
-                        and dev_eui in self._values_cache
-                    ):
-                        self._values_cache[dev_eui] = self.join_filtered_messages(
-                            self._values_cache[dev_eui],
-                            payload_struct,
-                            self._top_level_msg_names,
-                        )
-                        self.publish_value_cache_record(
-                            subtopics, "cur", dev_eui, payload_struct, retain=True
-                        )
-            else:
-                _LOGGER.info(
-                    "Ignoring topic %s with payload %s",
-                    message.topic,
-                    message.payload,
-                )
+            self.route_message(message, route)
+        if route:   # device messages do not change bridge/config state checked below
+            return
         if (
             len(self._devices_config_topics) > 0
             and self._config_topics_published > 0
@@ -657,69 +1037,240 @@ class ChirpToHA:
             self.clean_up_disappeared()
         if self._bridge_config_topics_published == 0:
             self._bridge_config_topics_published = -1
-            time.sleep(self._discovery_delay)
-            if not self._bridge_state_received:
-                self.publish(
-                    self._bridge_state_topic, f'{{"state": "online", "log_level": "{self._config.get(CONF_OPTIONS_LOG_LEVEL, DEFAULT_OPTIONS_LOG_LEVEL)}"}}', retain=True
-                )
-                _LOGGER.info(
-                    "Bridge state turned on, log level %s",
-                    self._config.get(CONF_OPTIONS_LOG_LEVEL, DEFAULT_OPTIONS_LOG_LEVEL),
-                )
+            self._bridge_online_timer = self._timers.call_later(self._discovery_delay, self.bridge_online)
+
+    def bridge_online(self):
+        """Timer callback to turn bridge state on and restore device values once discovery delay after bridge configuration passed."""
+        if not self._bridge_state_received:
+            self.publish_bridge_state()
+        if not self.restore_stored_values() or self._cur_pending:
             self.enable_cur()
-            for restore_message in self._messages_to_restore_values:
+        for record in list(self._devices.values()):
+            restore_messages, record.restore_messages = record.restore_messages, []
+            for restore_message in restore_messages:
                 self.publish(*restore_message)
                 _LOGGER.info(
-                    f"Previous sensor values restored for device {restore_message[0].split('/')[3]}",
+                    f"Previous sensor values restored for device {record.dev_eui}",
+                )
+        if self._startup_duration is None:
+            self._startup_duration = round(time.monotonic() - self._connect_time, 3)
+            _LOGGER.info("Bridge online %ss after MQTT connection", self._startup_duration)
+        self._bridge_online_timer = None
+
+    def route_message(self, message, route):
+        """Dispatch device event or discovery config message to handler selected by topic pattern."""
+        if route:
+            handler = self._event_handlers.get(route["event"])
+        else:
+            route = self._config_topic_pattern.match(message.topic) or self._device_config_topic_pattern.match(message.topic)
+            handler = self.on_config_message if route else None
+        payload_struct = json_loads(message.payload) if handler and len(message.payload) > 2 else None
+        if payload_struct:
+            time_stamp = payload_struct.get("time_stamp")
+            _LOGGER.detail(f"Processing message with time stamp {time_stamp} for topic {message.topic} and payload {payload_struct}")
+            handler(message.topic, route, payload_struct, time_stamp)
+        else:
+            _LOGGER.info(
+                "Ignoring topic %s with payload %s",
+                message.topic,
+                message.payload,
+            )
+
+    def on_bridge_state_message(self, payload):
+        """Process bridge state message: apply requested log level."""
+        self._bridge_state_received = True
+        _LOGGER.info("Bridge state message received")
+        try:
+            logging.getLogger().setLevel(json.loads(payload).get("log_level").upper())
+        except Exception as error:
+            _LOGGER.error("Bridge state message processing failed: %s", str(error))
+
+    def on_bridge_restart_message(self, payload):
+        """Process bridge restart request: reload devices."""
+        _LOGGER.info(
+            "Bridge restart requested"
+        )
+        self._bridge_config_topics_published = 0    # enables value restoration
+        self.revalidate_devices(incremental=self._incremental_reload)
+
+    def on_bridge_live_message(self, payload):
+        """Process device status resync request or expired device deadlines."""
+        _LOGGER.debug("Bridge device live status update requested")
+        if payload == "start":
+            self.resync_devices_status()
+        else:
+            try:
+                offline_devices = json.loads(payload).get("offline", [])
+            except (ValueError, AttributeError):
+                _LOGGER.debug("Bridge live message '%s' ignored", payload)
+                return
+            for dev_eui in offline_devices:
+                if self._offline_deadlines.get(dev_eui) is None:    # not rescheduled by recent uplink
+                    self.publish_device_status(dev_eui, "offline")
+
+    def on_ha_status_message(self, payload):
+        """Process HA online/offline message."""
+        if payload == "online":
+            self._ha_online_event.set()
+            if self._ha_online_timer:
+                self._ha_online_timer.cancel()
+            self.publish( self._initialize_topic, "configure" )
+            _LOGGER.info(
+                "HA online, continuing configuration"
+            )
+        elif payload == "offline":
+            _LOGGER.info(
+                "HA offline message received",
+            )
+
+    def on_initialize_message(self, payload):
+        """Process bridge setup initialize/configure/discover message."""
+        _LOGGER.info(
+            "Bridge setup '%s' message received",
+            payload
+        )
+        if payload == "initialize":
+            self._ha_online_timer = self._timers.call_later(self._discovery_delay+0.1, self.ha_online_timeout)
+            if self._per_device_online:
+                self._next_resync = time.time() + self._per_device_chk_interval*60
+                self.schedule_dev_check()
+                _LOGGER.info("Periodic device check task started for %s minute(s) interval", self._per_device_chk_interval)
+        elif payload == "configure":
+            self.subscribe(self._bridge_state_topic)
+            self.subscribe(self._bridge_restart_topic)
+            self.subscribe(
+                f"{self._chirpstack_prefix}application/{self._application_id}/device/+/event/up"
+            )
+            self.subscribe(f"{self._discovery_prefix}/+/+/+/config")
+            self.subscribe(f"{self._discovery_prefix}/device/+/config")    # device-based discovery, also to clean up after mode switch
+            self.publish(self._initialize_topic, "discover")    # delivered after retained configs of subscriptions above
+        elif payload == "discover":    # retained configs processed, config hashes seeded before devices reload
+            self.start_bridge()
+            if self._device_set_cache and self._device_set_cache.device_set:
+                self.publish_device_set()
+            self.revalidate_devices()
+
+    def on_config_message(self, topic, route, payload_struct, time_stamp):
+        """Process retained discovery config message: account published bridge and device configs."""
+        device = payload_struct.get("device") or payload_struct.get("dev")     # full or abbreviated (compact) payload
+        if device:
+            if (
+                "via_device" in device
+                and device["via_device"]
+                == self._bridge_indentifier
+            ):
+                _LOGGER.info(f"Registration message with time stamp {time_stamp} received for device {route['dev_eui']} sensor {route['integration']}")
+                self._old_devices_config_topics.add(topic)
+                self._config_topics_hashes[topic] = get_config_hash(payload_struct)
+                components = payload_struct.get("components") or payload_struct.get("cmps")
+                if components:
+                    self._device_components[topic] = {
+                        object_id: component.get("platform") or component.get("p")
+                        for object_id, component in components.items()
+                        if len(component) > 1   # platform only components are removal requests
+                    }
+                if (
+                    time_stamp and self._bridge_init_time and float(time_stamp) >= self._bridge_init_time
+                ):
+                    self._config_topics_published += 1
+            else:
+                self._bridge_config_topics_published -= 1
+
+    def on_cur_message(self, topic, route, payload_struct, time_stamp):
+        """Process retained device values message: restore values or remove values of unknown device."""
+        dev_eui = route["dev_eui"]
+        record = self._devices.get(dev_eui)
+        _LOGGER.info("Cached values received for device %s", dev_eui)
+        _LOGGER.debug(
+            "Cached values payload time %s, bridge time %s, cached object %s, value cache %s",
+            time_stamp,
+            self._bridge_init_time,
+            payload_struct.get("object"),
+            record.values if record else None,
+        )
+        if (
+            time_stamp and float(time_stamp) < self._bridge_init_time
+        ):
+            if record is None:
+                self.publish(topic, None, retain=True)
+                _LOGGER.debug(
+                    "Value cache removal topic %s published",
+                    topic,
                 )
-            self._messages_to_restore_values = []
+            elif record.values == {} and self._cur_open_time and time_stamp < self._cur_open_time:
+                self.publish_value_cache_record(record, "up", payload_struct)
+        self._cur_pending.discard(dev_eui)
+        _LOGGER.debug("%s device(s) cached values not processed", len(self._cur_pending))
+        if self._cur_completion and not self._cur_pending:
+            self.disable_cur("all devices retained values received")
+
+    def on_up_message(self, topic, route, payload_struct, time_stamp):
+        """Process device uplink: update device values cache and status."""
+        record = self._devices.get(route["dev_eui"])
+        if (
+            not time_stamp
+            and record is not None
+        ):
+            if self._per_device_online:
+                self.device_seen(record)
+            self.publish_value_cache_record(record, "cur", payload_struct, retain=True)
 
     def publish_value_cache_record(
-        self, topic_array, topic_suffix, dev_eui, payload_struct, retain=False
+        self, record, topic_suffix, payload_struct, retain=False, status=None
     ):
         """Publish sensor value to values cache message."""
-
-        self._values_cache[dev_eui] = self.join_filtered_messages(
-            self._values_cache[dev_eui],
-            payload_struct,
-            self._top_level_msg_names,
-        )
-        payload_struct = self._values_cache[dev_eui]
+        dev_eui = record.dev_eui
+        record.values = record.merge_values(record.values, payload_struct)
+        payload_struct = record.values
+        if payload_struct:
+            self._cur_pending.discard(dev_eui)
 
         if len(payload_struct) or topic_suffix == "cur":
-            topic_int = topic_array.copy()
-            topic_int[-1] = topic_suffix
             payload_struct["time_stamp"] = time.time()
-            publish_topic = "/".join(topic_int)
+            if self._values_store:
+                self._values_store.put(dev_eui, payload_struct)
+            publish_topic = record.event_topic(topic_suffix)
             if topic_suffix == "cur" and self._per_device_online:
                 payload_struct = payload_struct.copy()
-                payload_struct["status"] = self.get_device_status(dev_eui)
+                payload_struct["status"] = status if status else self.get_device_status(dev_eui)
 
             ret_val = self.publish(
                 publish_topic, json.dumps(payload_struct), retain=retain
             )
             _LOGGER.debug(
-                f"Cached values published for device {topic_int[3]} and topic {topic_suffix} {publish_topic}",
+                f"Cached values published for device {dev_eui} and topic {topic_suffix} {publish_topic}",
             )
         else:
             ret_val = (0,0)
         return ret_val
 
     def join_filtered_messages(self, message_o, message_n, levels_filter):
-        """Join 2 payloads keeping all level data and recent values from message_n."""
-        if isinstance(levels_filter, list):
-            filtered = [{}]
-            for level_filter in levels_filter[0]:
-                message_o_r = message_o[0].get(level_filter) if message_o else None
-                message_n_r = message_n[0].get(level_filter) if message_n else None
-                if message_o_r==None and message_n_r==None:
-                    continue
-                filtered[0][level_filter] = self.join_filtered_messages(
-                    message_o_r, message_n_r, levels_filter[0].get(level_filter)
+        """Join 2 payloads keeping all level data and recent values from message_n, reference for compiled _merge_values."""
+        if levels_filter == {} or levels_filter == [{}]:
+            filtered = message_n if message_n!=None else message_o
+        elif isinstance(levels_filter, list):
+            if message_n == None:
+                message_n, message_o = message_o, None
+            if not isinstance(message_n, list):
+                return message_n
+            message_o = message_o if isinstance(message_o, list) else []
+            filtered = [
+                self.join_filtered_messages(
+                    message_o[index] if index < len(message_o) and isinstance(message_o[index], dict) else None,
+                    item,
+                    levels_filter[0],
                 )
-        elif levels_filter == {}:
+                if isinstance(item, dict)
+                else item
+                for index, item in enumerate(message_n)
+            ]
+        elif (
+            message_n != None and not isinstance(message_n, dict)
+            or message_n == None and message_o != None and not isinstance(message_o, dict)
+        ):  # not a dict level in payload: value is kept as whole
             filtered = message_n if message_n!=None else message_o
         else:
+            message_o = message_o if isinstance(message_o, dict) else None
             filtered = {}
             for level_filter in levels_filter:
                 message_o_r = message_o.get(level_filter) if message_o else None
@@ -758,21 +1309,14 @@ class ChirpToHA:
                 )
         return mqtt_integration
 
-    def get_availability_element(self, dev_id, sensor, device, dev_conf):
-        if self._per_device_online:
-            availability_elements = self._availability_element.copy()
-            for availability_element in availability_elements:
-                availability_element["topic"] = f"{self._chirpstack_prefix}application/{self._application_id}/device/{dev_conf['dev_eui']}/event/cur"
-            return availability_elements
-        else:
-            return self._availability_element
-
-    def get_conf_data(self, dev_id, sensor, device, dev_conf):
-        """Prepare discovery payload."""
+    def get_conf_data(self, dev_id, sensor, device, dev_conf, record=None):
+        """Prepare discovery payload, device topics and availability are taken from device record."""
+        if record is None:
+            record = self.new_device_record(dev_conf["dev_eui"])
         mqtt_integration = self.get_integration(dev_id, sensor, device, dev_conf)
         discovery_topic = f"{self._discovery_prefix}/{mqtt_integration}/{dev_conf['dev_eui']}/{dev_id}/config"
-        status_topic = f"{self._chirpstack_prefix}application/{self._application_id}/device/{dev_conf['dev_eui']}/event/{sensor.get('data_event') if sensor.get('data_event') else 'up'}"
-        comand_topic = f"{self._chirpstack_prefix}application/{self._application_id}/device/{dev_conf['dev_eui']}/command/down"
+        status_topic = record.event_topic(sensor.get("data_event") or "up")
+        comand_topic = record.command_topic
         discovery_config = sensor["entity_conf"].copy()
         discovery_config["device"] = device.copy()
         for key in list(discovery_config["device"]):
@@ -790,7 +1334,7 @@ class ChirpToHA:
                 to_lower_case_no_blanks(BRIDGE_VENDOR + "_" + dev_conf["dev_eui"])
             ]
             discovery_config["device"]["via_device"] = self._bridge_indentifier
-            discovery_config["availability"] = self.get_availability_element(dev_id, sensor, discovery_config["device"], dev_conf)
+            discovery_config["availability"] = record.availability
         discovery_config["origin"] = self._origin
         if not discovery_config.get("state_topic"):
             discovery_config["state_topic"] = status_topic
@@ -833,18 +1377,31 @@ class ChirpToHA:
             discovery_config["enabled_by_default"] = True
         if self._bridge_init_time:
             discovery_config["time_stamp"] = self._bridge_init_time
+        payload_struct, payload = self.get_discovery_payload(discovery_config, dev_conf["dev_eui"])
         return {
             "discovery_config_struct": discovery_config,
-            "discovery_config": json.dumps(discovery_config),
+            "discovery_payload_struct": payload_struct,
+            "discovery_config": payload,
+            "config_hash": get_config_hash(payload_struct),
             "discovery_topic": discovery_topic,
             "status_topic": status_topic,
             "comand_topic": comand_topic,
+            "integration": mqtt_integration,
+            "object_id": dev_id,
+            "dev_eui": dev_conf["dev_eui"],
         }
 
     def close(self):
         """Close recent session."""
         self._ha_online_event.set()
-        self._cur_delay_event.set()
-        self._dev_check_event.set()
+        self._timers.close()
+        self._publisher.close()
 
         self._client.disconnect()
+        if self._transport:
+            self._client.loop_write()   # flush disconnect request before socket is released
+            self._transport.close()
+        self._dispatcher.close()
+        _LOGGER.info("Message workers stopped, %s", self._dispatcher.get_queue_info())
+        if self._values_store:
+            self._values_store.close()
@@ -0,0 +1,133 @@
+"""The ChirpStack LoRaWAN Integration - staged processing pipeline."""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+PIPELINE_END = object()
+PIPELINE_WAIT = 0.1
+
+
+class PipelineError:
+    """Stage failure marker passed downstream to pipeline consumer."""
+
+    def __init__(self, error) -> None:
+        """Keep stage exception."""
+        self.error = error
+
+
+class Pipeline:
+    """Run generator stages in own threads connected by bounded queues, collect per stage busy time and item counts."""
+
+    def __init__(self, queue_size) -> None:
+        """Initialize empty pipeline."""
+        self._queue_size = queue_size
+        self._stages = []
+        self._stop = threading.Event()
+        self._input_wait = {}
+        self.timings = {}
+        self.counts = {}
+
+    def add_stage(self, name, stage):
+        """Add stage, stage is called with input items iterable and returns output items iterable."""
+        self._stages.append((name, stage))
+        self._input_wait[name] = 0
+        self.timings[name] = 0
+        self.counts[name] = 0
+        return self
+
+    def put(self, output_queue, item):
+        """Put item to queue waiting for free space, return False if pipeline stopped."""
+        while not self._stop.is_set():
+            try:
+                output_queue.put(item, timeout=PIPELINE_WAIT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, input_queue):
+        """Get item from queue, end marker if pipeline stopped."""
+        while not self._stop.is_set():
+            try:
+                return input_queue.get(timeout=PIPELINE_WAIT)
+            except queue.Empty:
+                continue
+        return PIPELINE_END
+
+    def input_items(self, name, input_queue):
+        """Yield stage input items, account time spent waiting for them, raise upstream stage failures."""
+        while True:
+            wait_start = time.monotonic()
+            item = self.get(input_queue)
+            self._input_wait[name] += time.monotonic() - wait_start
+            if item is PIPELINE_END:
+                return
+            if isinstance(item, PipelineError):
+                raise item.error
+            yield item
+
+    def run_stage(self, name, stage, input_queue, output_queue):
+        """Thread app to run single stage and pass its results to next stage."""
+        items = None
+        try:
+            items = stage(self.input_items(name, input_queue) if input_queue else iter(()))
+            wait_before = self._input_wait[name]
+            item_start = time.monotonic()
+            for item in items:
+                self.timings[name] += time.monotonic() - item_start - (self._input_wait[name] - wait_before)
+                self.counts[name] += 1
+                if not self.put(output_queue, item):
+                    break
+                wait_before = self._input_wait[name]
+                item_start = time.monotonic()
+            else:
+                self.timings[name] += time.monotonic() - item_start - (self._input_wait[name] - wait_before)
+            self.put(output_queue, PIPELINE_END)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.debug("Pipeline stage %s failed: %s", name, str(error))
+            self.put(output_queue, PipelineError(error))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+
+    def run(self, sink_name):
+        """Start stages and yield last stage results, time spent by caller between results is accounted to sink_name."""
+        self._input_wait[sink_name] = 0
+        self.timings[sink_name] = 0
+        self.counts[sink_name] = 0
+        threads = []
+        input_queue = None
+        for name, stage in self._stages:
+            output_queue = queue.Queue(maxsize=self._queue_size)
+            threads.append(
+                threading.Thread(
+                    target=self.run_stage,
+                    args=(name, stage, input_queue, output_queue),
+                    name=f"chirp_{name}",
+                )
+            )
+            input_queue = output_queue
+        for thread in threads:
+            thread.start()
+        try:
+            for item in self.input_items(sink_name, input_queue):
+                item_start = time.monotonic()
+                yield item
+                self.timings[sink_name] += time.monotonic() - item_start
+                self.counts[sink_name] += 1
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+    def get_timings_info(self):
+        """Get per stage timings and item counts as printable string."""
+        return ", ".join(
+            f"{name} {self.timings[name]:.3f}s/{self.counts[name]}"
+            for name in self.timings
+        )
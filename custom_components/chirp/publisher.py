@@ -0,0 +1,118 @@
+"""The ChirpStack LoRaWAN Integration - rate limited discovery publishing."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+ACK_TIMEOUT = 5     # seconds to wait for in-flight messages before window is considered lost (reconnect)
+
+
+class PublishScheduler:
+    """Pace publishing by token bucket and in-flight window, publishing thread is blocked while limits are reached."""
+
+    def __init__(self, rate=0, window=0, clock=time.monotonic) -> None:
+        """Set publish rate in messages per second and maximum in-flight messages, 0 for no limit."""
+        self._rate = float(rate)
+        self._window = int(window)
+        self._clock = clock
+        self._burst = max(1.0, float(self._window or self._rate))
+        self._tokens = self._burst
+        self._last_refill = clock()
+        self._condition = threading.Condition()
+        self._in_flight = set()
+        self._local = threading.local()
+        self._closed = False
+        self.published = 0
+        self.max_in_flight = 0
+        self.throttled = 0.0
+        self.start_time = None
+
+    @property
+    def tracks_acks(self):
+        """Check if publish acknowledgements are needed for in-flight window."""
+        return self._window > 0
+
+    def in_flight(self):
+        """Get number of published messages not yet acknowledged."""
+        return len(self._in_flight)
+
+    def begin(self):
+        """Reset metrics for new publishing burst."""
+        with self._condition:
+            self.published = 0
+            self.max_in_flight = 0
+            self.throttled = 0.0
+            self.start_time = self._clock()
+
+    def rate(self):
+        """Get achieved publish rate of current burst in messages per second."""
+        if self.start_time is None:
+            return None
+        elapsed = self._clock() - self.start_time
+        return round(self.published / elapsed, 1) if elapsed > 0 else None
+
+    def acquire(self):
+        """Wait for publish token and free in-flight window slot."""
+        with self._condition:
+            wait_start = self._clock()
+            while not self._closed:
+                if self._window and len(self._in_flight) >= self._window:
+                    if not self._condition.wait(ACK_TIMEOUT) and len(self._in_flight) >= self._window:
+                        _LOGGER.warning(
+                            "No publish acknowledgement within %ss, %s in-flight message(s) dropped from window",
+                            ACK_TIMEOUT,
+                            len(self._in_flight),
+                        )
+                        self._in_flight.clear()
+                    continue
+                if self._rate:
+                    now = self._clock()
+                    self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+                    self._last_refill = now
+                    if self._tokens < 1:
+                        self._condition.wait((1 - self._tokens) / self._rate)
+                        continue
+                    self._tokens -= 1
+                break
+            self.throttled += self._clock() - wait_start
+
+    def publish(self, publish_fn, *args, **kwargs):
+        """Publish by passed function once limits allow, track message id till acknowledged."""
+        self.acquire()
+        with self._condition:   # acknowledgement from network thread waits till message id is tracked
+            self._local.acked = set()
+            try:
+                ret_val = publish_fn(*args, **kwargs)
+            finally:
+                acked, self._local.acked = self._local.acked, None
+            self.published += 1
+            if self._window and ret_val.mid not in acked:   # paho could send and acknowledge qos 0 message inside publish call
+                self._in_flight.add(ret_val.mid)
+                self.max_in_flight = max(self.max_in_flight, len(self._in_flight))
+        return ret_val
+
+    def on_publish(self, mid):
+        """Release in-flight window slot of acknowledged message."""
+        acked = getattr(self._local, "acked", None)
+        if acked is not None:
+            acked.add(mid)
+        with self._condition:
+            if mid in self._in_flight:
+                self._in_flight.discard(mid)
+                self._condition.notify_all()
+
+    def get_publish_info(self):
+        """Get publishing metrics as printable string."""
+        return (
+            f"{self.published} message(s) published at {self.rate()} msg/s, in flight {self.in_flight()}, "
+            f"max in flight {self.max_in_flight}, throttled {self.throttled:.3f}s"
+        )
+
+    def close(self):
+        """Release waiting publishers, limits are not applied after close."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
@@ -0,0 +1,44 @@
+"""The ChirpStack LoRaWAN Integration - bridged device records."""
+from __future__ import annotations
+
+
+class DeviceRecord:
+    """Device topics and availability prepared on reload, device payload fields merge and runtime state."""
+
+    __slots__ = (
+        "dev_eui",
+        "topic_base",
+        "up_topic",
+        "cur_topic",
+        "command_topic",
+        "availability",
+        "merge_values",
+        "values",
+        "status",
+        "restore_messages",
+    )
+
+    def __init__(self, dev_eui, topic_base, bridge_availability, per_device_online=False, merge_values=None) -> None:
+        """Prepare device topics below topic_base, per device availability refers to device cur topic."""
+        self.dev_eui = dev_eui
+        self.topic_base = topic_base
+        self.up_topic = f"{topic_base}/event/up"
+        self.cur_topic = f"{topic_base}/event/cur"
+        self.command_topic = f"{topic_base}/command/down"
+        self.availability = (
+            [dict(element, topic=self.cur_topic) for element in bridge_availability]
+            if per_device_online
+            else bridge_availability
+        )
+        self.merge_values = merge_values
+        self.values = {}
+        self.status = None
+        self.restore_messages = []
+
+    def event_topic(self, event):
+        """Get device event topic."""
+        if event == "up":
+            return self.up_topic
+        if event == "cur":
+            return self.cur_topic
+        return f"{self.topic_base}/event/{event}"
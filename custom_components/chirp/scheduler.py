@@ -0,0 +1,176 @@
+"""The ChirpStack LoRaWAN Integration - per key deadlines scheduling."""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeadlineHeap:
+    """Min-heap of per key deadlines, rescheduling a key invalidates its previous heap entry."""
+
+    def __init__(self) -> None:
+        """Initialize empty schedule."""
+        self._heap = []
+        self._deadlines = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Get number of scheduled keys."""
+        return len(self._deadlines)
+
+    def get(self, key):
+        """Get key deadline, None if key is not scheduled."""
+        return self._deadlines.get(key)
+
+    def schedule(self, key, deadline):
+        """Set key deadline, return True if it is the earliest deadline now."""
+        with self._lock:
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, key))
+            if len(self._heap) > 2 * len(self._deadlines) + 16:
+                self._heap = [(dl, k) for dl, k in self._heap if self._deadlines.get(k) == dl]
+                heapq.heapify(self._heap)
+            return self._heap[0] == (deadline, key)
+
+    def cancel(self, key):
+        """Remove key from schedule, heap entry is dropped when it reaches heap top."""
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def next_deadline(self):
+        """Get earliest deadline, None if nothing scheduled."""
+        with self._lock:
+            self.drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return keys with deadline not later than now, earliest first."""
+        due = []
+        with self._lock:
+            self.drop_stale()
+            while self._heap and self._heap[0][0] <= now:
+                _, key = heapq.heappop(self._heap)
+                del self._deadlines[key]
+                due.append(key)
+                self.drop_stale()
+        return due
+
+    def drop_stale(self):
+        """Remove rescheduled/cancelled entries from heap top, caller holds lock."""
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+
+class TimerHandle:
+    """Cancellable timer scheduled by timer service."""
+
+    def __init__(self, service, timer_id) -> None:
+        """Keep timer reference."""
+        self._service = service
+        self._timer_id = timer_id
+
+    def cancel(self):
+        """Cancel timer, no effect if already run."""
+        self._service.cancel(self._timer_id)
+
+
+class TimerService:
+    """Delayed callbacks from single deadline heap, run by own thread or event loop, clock could be injected."""
+
+    def __init__(self, clock=time.monotonic, name="chirp_timers") -> None:
+        """Initialize timer service, callbacks are run after start or by run_due calls."""
+        self._clock = clock
+        self._name = name
+        self._deadlines = DeadlineHeap()
+        self._callbacks = {}
+        self._timer_ids = itertools.count()
+        self._wakeup_event = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._loop_handle = None
+        self._closed = False
+
+    def __len__(self):
+        """Get number of pending timers."""
+        return len(self._deadlines)
+
+    def time(self):
+        """Get current time of service clock."""
+        return self._clock()
+
+    def call_later(self, delay, callback, *args):
+        """Schedule callback after delay seconds, return cancellable handle."""
+        timer_id = next(self._timer_ids)
+        self._callbacks[timer_id] = (callback, args)
+        if self._deadlines.schedule(timer_id, self._clock() + delay):
+            self.wakeup()
+        return TimerHandle(self, timer_id)
+
+    def cancel(self, timer_id):
+        """Remove timer from schedule."""
+        self._deadlines.cancel(timer_id)
+        self._callbacks.pop(timer_id, None)
+
+    def run_due(self):
+        """Run callbacks with expired deadlines, earliest first."""
+        for timer_id in self._deadlines.pop_due(self._clock()):
+            callback, args = self._callbacks.pop(timer_id, (None, None))
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                _LOGGER.error("Timer callback %s failed: %s", callback.__name__, str(error))
+
+    def start(self, loop=None):
+        """Start running timers on event loop if given, on own thread otherwise."""
+        if loop:
+            self._loop = loop
+            self.wakeup()
+        else:
+            self._thread = threading.Thread(target=self.worker, name=self._name, daemon=True)
+            self._thread.start()
+
+    def wakeup(self):
+        """Recalculate wait time after earliest deadline change."""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self.arm_loop)
+        else:
+            self._wakeup_event.set()
+
+    def arm_loop(self):
+        """Set event loop timer for earliest deadline, called on event loop."""
+        if self._loop_handle:
+            self._loop_handle.cancel()
+            self._loop_handle = None
+        next_deadline = self._deadlines.next_deadline()
+        if not self._closed and next_deadline is not None:
+            self._loop_handle = self._loop.call_later(max(next_deadline - self._clock(), 0), self.on_loop_timer)
+
+    def on_loop_timer(self):
+        """Event loop timer callback."""
+        self._loop_handle = None
+        self.run_due()
+        self.arm_loop()
+
+    def worker(self):
+        """Thread app to run timer callbacks till service is closed."""
+        while True:
+            self._wakeup_event.clear()
+            if self._closed:
+                break
+            next_deadline = self._deadlines.next_deadline()
+            if next_deadline is not None and next_deadline <= self._clock():
+                self.run_due()
+                continue
+            self._wakeup_event.wait(None if next_deadline is None else next_deadline - self._clock())
+
+    def close(self):
+        """Stop running timers, pending timers are dropped."""
+        self._closed = True
+        self.wakeup()
@@ -9,6 +9,7 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfTime
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -20,7 +21,12 @@ from .const import (
     INTEGRATION_DEV_NAME,
     MQTTCLIENT,
     STATISTICS_DEVICES,
+    STATISTICS_OVERFLOW,
+    STATISTICS_PUBLISH_RATE,
+    STATISTICS_PUBLISH_THROTTLED,
+    STATISTICS_QUEUE,
     STATISTICS_SENSORS,
+    STATISTICS_STARTUP,
     STATISTICS_UPDATED,
 )
 
@@ -48,6 +54,44 @@ SENSORS = [
         device_class=SensorDeviceClass.TIMESTAMP,
         translation_key=STATISTICS_UPDATED,
     ),
+    SensorEntityDescription(
+        STATISTICS_QUEUE,
+        name="Message queue depth",
+        has_entity_name=True,
+        state_class=SensorStateClass.MEASUREMENT,
+        translation_key=STATISTICS_QUEUE,
+    ),
+    SensorEntityDescription(
+        STATISTICS_OVERFLOW,
+        name="Message overflow depth",
+        has_entity_name=True,
+        state_class=SensorStateClass.MEASUREMENT,
+        translation_key=STATISTICS_OVERFLOW,
+    ),
+    SensorEntityDescription(
+        STATISTICS_STARTUP,
+        name="Startup duration",
+        has_entity_name=True,
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        translation_key=STATISTICS_STARTUP,
+    ),
+    SensorEntityDescription(
+        STATISTICS_PUBLISH_RATE,
+        name="Discovery publish rate",
+        has_entity_name=True,
+        state_class=SensorStateClass.MEASUREMENT,
+        native_unit_of_measurement="msg/s",
+        translation_key=STATISTICS_PUBLISH_RATE,
+    ),
+    SensorEntityDescription(
+        STATISTICS_PUBLISH_THROTTLED,
+        name="Discovery publish throttled time",
+        has_entity_name=True,
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.SECONDS,
+        translation_key=STATISTICS_PUBLISH_THROTTLED,
+    ),
 ]
 
 
@@ -102,3 +146,13 @@ class ChirpSensor(SensorEntity):
             self._attr_native_value = self._mqtt_client._dev_count
         elif self.entity_description.key == STATISTICS_UPDATED:
             self._attr_native_value = self._mqtt_client._last_update
+        elif self.entity_description.key == STATISTICS_QUEUE:
+            self._attr_native_value = self._mqtt_client._dispatcher.queue_depth()
+        elif self.entity_description.key == STATISTICS_OVERFLOW:
+            self._attr_native_value = self._mqtt_client._dispatcher.overflow_depth()
+        elif self.entity_description.key == STATISTICS_STARTUP:
+            self._attr_native_value = self._mqtt_client._startup_duration
+        elif self.entity_description.key == STATISTICS_PUBLISH_RATE:
+            self._attr_native_value = self._mqtt_client._publish_rate
+        elif self.entity_description.key == STATISTICS_PUBLISH_THROTTLED:
+            self._attr_native_value = self._mqtt_client._publish_throttled
@@ -0,0 +1,83 @@
+"""The ChirpStack LoRaWAN Integration - persistent device values store."""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ValuesStore:
+    """Keep last device values in SQLite file, updates are buffered and written in batches."""
+
+    def __init__(self, file_name) -> None:
+        """Open store file, create values table if missing."""
+        self._file_name = file_name
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.writes = 0
+        self.batches = 0
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        self._connection = sqlite3.connect(file_name, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS device_values (dev_eui TEXT PRIMARY KEY, payload TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def load(self):
+        """Get stored values of all devices."""
+        values = {}
+        try:
+            for dev_eui, payload in self._connection.execute("SELECT dev_eui, payload FROM device_values"):
+                values[dev_eui] = json.loads(payload)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning("Values store %s load failed: %s", self._file_name, str(error))
+        _LOGGER.debug("Values store %s loaded, %s device(s)", self._file_name, len(values))
+        return values
+
+    def put(self, dev_eui, payload_struct):
+        """Buffer device values for next batch, newer values replace buffered ones."""
+        with self._lock:
+            self._pending[dev_eui] = payload_struct
+
+    def delete(self, dev_eui):
+        """Buffer device values removal for next batch."""
+        with self._lock:
+            self._pending[dev_eui] = None
+
+    def flush(self):
+        """Write buffered updates in single transaction."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = time.time()
+        with self._write_lock:
+            try:
+                with self._connection:
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO device_values (dev_eui, payload, updated) VALUES (?, ?, ?)",
+                        [(dev_eui, json.dumps(payload), now) for dev_eui, payload in pending.items() if payload is not None],
+                    )
+                    self._connection.executemany(
+                        "DELETE FROM device_values WHERE dev_eui = ?",
+                        [(dev_eui,) for dev_eui, payload in pending.items() if payload is None],
+                    )
+                self.writes += len(pending)
+                self.batches += 1
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                _LOGGER.warning("Values store %s write failed: %s", self._file_name, str(error))
+
+    def close(self):
+        """Write buffered updates and close store file."""
+        self.flush()
+        with self._write_lock:
+            self._connection.close()
+        _LOGGER.debug("Values store %s closed, %s update(s) written in %s batch(es)", self._file_name, self.writes, self.batches)
@@ -0,0 +1,131 @@
+"""The ChirpStack LoRaWAN Integration - value template payload fields extraction."""
+from __future__ import annotations
+
+from functools import lru_cache
+import logging
+
+from jinja2 import Environment, nodes
+
+_LOGGER = logging.getLogger(__name__)
+
+PAYLOAD_NAME = "value_json"
+LIST_ITEM = None
+
+_ENVIRONMENT = Environment()
+
+
+def get_access_path(node):
+    """Get payload field path for value_json attribute/subscript chain, None if chain is not based on value_json."""
+    path = []
+    while isinstance(node, (nodes.Getattr, nodes.Getitem)):
+        if isinstance(node, nodes.Getattr):
+            path.append(node.attr)
+        elif isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+            path.append(node.arg.value)
+        else:
+            path.append(LIST_ITEM)
+        node = node.node
+    if isinstance(node, nodes.Name) and node.name == PAYLOAD_NAME:
+        return tuple(reversed(path))
+    return None
+
+
+def find_access_paths(node, paths):
+    """Collect longest value_json access paths found in template syntax tree."""
+    if isinstance(node, (nodes.Getattr, nodes.Getitem)):
+        path = get_access_path(node)
+        if path:
+            paths.add(path)
+            while isinstance(node, (nodes.Getattr, nodes.Getitem)):   # subscripts may refer to payload too
+                if isinstance(node, nodes.Getitem):
+                    find_access_paths(node.arg, paths)
+                node = node.node
+            return
+    for child in node.iter_child_nodes():
+        find_access_paths(child, paths)
+
+
+@lru_cache(maxsize=1024)
+def get_template_paths(template):
+    """Get payload field paths used by template, parsed once per distinct template string."""
+    paths = set()
+    try:
+        find_access_paths(_ENVIRONMENT.parse(template), paths)
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        _LOGGER.warning("Template '%s' parsing failed: %s", template, str(error))
+    return tuple(sorted(paths, key=lambda path: tuple(str(name) for name in path)))
+
+
+def add_template_paths(fields_tree, template):
+    """Add payload fields used by template to fields tree, list levels are kept as single element lists."""
+    for path in get_template_paths(template):
+        while path and path[-1] is LIST_ITEM:  # subscripted field value is used as whole
+            path = path[:-1]
+        level = fields_tree
+        for index, name in enumerate(path):
+            if name is LIST_ITEM:
+                continue
+            is_list = index + 1 < len(path) and path[index + 1] is LIST_ITEM
+            if name not in level:
+                level[name] = [{}] if is_list else {}
+            level = level[name][0] if isinstance(level[name], list) else level[name]
+    return fields_tree
+
+
+def merge_list_values(old_list, new_list, merge_item):
+    """Merge list field values by index, dict elements are merged by merge_item, other elements and values copied."""
+    if new_list is None:
+        new_list, old_list = old_list, None
+    if not isinstance(new_list, list):
+        return new_list
+    old_list = old_list if isinstance(old_list, list) else []
+    return [
+        merge_item(old_list[index] if index < len(old_list) and isinstance(old_list[index], dict) else None, item)
+        if isinstance(item, dict)
+        else item
+        for index, item in enumerate(new_list)
+    ]
+
+
+def get_merge_code(fields_tree, old_name, new_name, result_name, lines, indent, names, functions):
+    """Append code lines merging old/new payload fields described by dict level of fields tree into result dict."""
+    for key, sub_tree in fields_tree.items():
+        names[0] += 1
+        old_value, new_value = f"o{names[0]}", f"n{names[0]}"
+        lines.append(f"{indent}{old_value} = {old_name}.get({key!r}) if {old_name} else None")
+        lines.append(f"{indent}{new_value} = {new_name}.get({key!r}) if {new_name} else None")
+        if sub_tree == {} or sub_tree == [{}]:
+            lines.append(f"{indent}if {new_value} is not None:")
+            lines.append(f"{indent}    {result_name}[{key!r}] = {new_value}")
+            lines.append(f"{indent}elif {old_value} is not None:")
+            lines.append(f"{indent}    {result_name}[{key!r}] = {old_value}")
+            continue
+        lines.append(f"{indent}if {old_value} is not None or {new_value} is not None:")
+        if isinstance(sub_tree, list):
+            merge_item = f"m{names[0]}"
+            functions[merge_item] = compile_fields_merge(sub_tree[0])
+            lines.append(f"{indent}    {result_name}[{key!r}] = merge_list_values({old_value}, {new_value}, {merge_item})")
+            continue
+        sub_result = f"r{names[0]}"
+        lines.append(   # not a dict level in payload: value is kept as whole
+            f"{indent}    if {new_value} is not None and not isinstance({new_value}, dict)"
+            f" or {new_value} is None and not isinstance({old_value}, dict):"
+        )
+        lines.append(f"{indent}        {result_name}[{key!r}] = {new_value} if {new_value} is not None else {old_value}")
+        lines.append(f"{indent}    else:")
+        lines.append(f"{indent}        {old_value} = {old_value} if isinstance({old_value}, dict) else None")
+        lines.append(f"{indent}        {sub_result} = {{}}")
+        lines.append(f"{indent}        {result_name}[{key!r}] = {sub_result}")
+        get_merge_code(sub_tree, old_value, new_value, sub_result, lines, indent + "        ", names, functions)
+
+
+def compile_fields_merge(fields_tree):
+    """Compile fields tree into function joining old and new payloads, keeping tree fields with recent values."""
+    lines = ["def merge_fields(o0, n0):", "    r0 = {}"]
+    namespace = {"merge_list_values": merge_list_values}
+    get_merge_code(fields_tree or {}, "o0", "n0", "r0", lines, "    ", [0], namespace)
+    lines.append("    return r0")
+    code = "\n".join(lines)
+    _LOGGER.debug("Payload fields merge code:\n%s", code)
+    exec(compile(code, "<chirp fields merge>", "exec"), namespace)  # pylint: disable=exec-used
+    return namespace["merge_fields"]
@@ -0,0 +1,131 @@
+"""The ChirpStack LoRaWAN Integration - MQTT client socket processing on asyncio event loop."""
+from __future__ import annotations
+
+import logging
+
+import paho.mqtt.client as mqtt
+
+_LOGGER = logging.getLogger(__name__)
+
+MISC_INTERVAL = 1
+
+
+class AsyncioTransport:
+    """Drive paho client socket by event loop reader/writer callbacks instead of loop_forever thread."""
+
+    def __init__(self, loop, client) -> None:
+        """Attach to paho client socket callbacks."""
+        self._loop = loop
+        self._client = client
+        self._socket = None
+        self._misc_handle = None
+        self._closed = False
+        self._reconnecting = False
+        self._reading_paused = False
+        self._client.on_socket_open = self.on_socket_open
+        self._client.on_socket_close = self.on_socket_close
+        self._client.on_socket_register_write = self.on_socket_register_write
+        self._client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def start(self):
+        """Register already connected client socket and start periodic keepalive processing, called on event loop."""
+        sock = self._client.socket()
+        if sock:
+            self.add_socket(sock)
+        self._misc_handle = self._loop.call_later(MISC_INTERVAL, self.misc)
+        _LOGGER.info("MQTT client socket processing started on event loop")
+
+    def on_socket_open(self, client, userdata, sock):
+        """Paho socket opened callback, called on (re)connect."""
+        self._loop.call_soon_threadsafe(self.add_socket, sock)
+
+    def on_socket_close(self, client, userdata, sock):
+        """Paho socket closed callback."""
+        self._loop.call_soon_threadsafe(self.remove_socket, sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        """Paho callback for outgoing data waiting, could be called by any publishing thread."""
+        self._loop.call_soon_threadsafe(self.add_writer, sock)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        """Paho callback for outgoing data sent."""
+        self._loop.call_soon_threadsafe(self.remove_writer, sock)
+
+    def add_socket(self, sock):
+        """Watch socket for incoming data, and for write readiness if outgoing data is pending."""
+        if self._closed:
+            return
+        if self._socket is not None and self._socket is not sock:
+            self.remove_socket(self._socket)
+        self._socket = sock
+        if not self._reading_paused:
+            self._loop.add_reader(sock, self.read)
+        if self._client.want_write():
+            self.add_writer(sock)
+
+    def remove_socket(self, sock):
+        """Stop watching socket."""
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        if self._socket is sock:
+            self._socket = None
+
+    def pause_reading(self, paused):
+        """Stop or resume processing incoming data while message workers catch up, called from any thread."""
+        self._loop.call_soon_threadsafe(self.set_reading_paused, paused)
+
+    def set_reading_paused(self, paused):
+        """Remove or add socket reader, called on event loop."""
+        self._reading_paused = paused
+        if self._closed or self._socket is None:
+            return
+        if paused:
+            self._loop.remove_reader(self._socket)
+            _LOGGER.warning("MQTT client socket reading paused till message workers catch up")
+        else:
+            self._loop.add_reader(self._socket, self.read)
+            _LOGGER.info("MQTT client socket reading resumed")
+
+    def add_writer(self, sock):
+        """Watch socket write readiness."""
+        if not self._closed and sock is self._socket:
+            self._loop.add_writer(sock, self.write)
+
+    def remove_writer(self, sock):
+        """Stop watching socket write readiness."""
+        self._loop.remove_writer(sock)
+
+    def read(self):
+        """Process incoming data."""
+        self._client.loop_read()
+
+    def write(self):
+        """Send pending outgoing data."""
+        self._client.loop_write()
+
+    def misc(self):
+        """Process keepalive and retries, reconnect in executor if connection is lost."""
+        if self._closed:
+            return
+        if self._client.loop_misc() == mqtt.MQTT_ERR_NO_CONN and self._socket is None and not self._reconnecting:
+            self._reconnecting = True
+            self._loop.run_in_executor(None, self.reconnect)
+        self._misc_handle = self._loop.call_later(MISC_INTERVAL, self.misc)
+
+    def reconnect(self):
+        """Reconnect to MQTT server, new socket is registered by socket open callback."""
+        try:
+            self._client.reconnect()
+            _LOGGER.info("MQTT client reconnected")
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning("MQTT client reconnect failed: %s", str(error))
+        finally:
+            self._reconnecting = False
+
+    def close(self):
+        """Stop socket processing, called on event loop after client disconnect request is flushed."""
+        self._closed = True
+        if self._misc_handle:
+            self._misc_handle.cancel()
+        if self._socket is not None:
+            self.remove_socket(self._socket)
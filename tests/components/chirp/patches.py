@@ -2,6 +2,7 @@
 import json
 import time
 import threading
+import socket
 import enum
 from queue import Queue
 import traceback
@@ -19,10 +20,13 @@ MODEL_SIZES = [
         "codec": 1,
         "subscribe": 1,
         "unsubscribe": 1,
+        "unavailable": False,
     }
 ]
 
 getdevcount = [0]
+getprofilecount = [0]
+listcount = [0]
 
 CODEC = [   # array of (no_of_sensors, "codec_code")
     (   #0
@@ -160,6 +164,8 @@ CODEC = [   # array of (no_of_sensors, "codec_code")
 
 def get_size(type_name):
     """Get test mock parameters."""
+    if type_name == "profiles":
+        return MODEL_SIZES[0]["profiles"] if MODEL_SIZES[0].get("profiles") else get_size("devices")
     if type_name == "sensors":
         return  0 if get_size("disabled") else CODEC[get_size("codec")][0]
     elif type_name == "idevices":
@@ -179,6 +185,9 @@ def set_size(
     disabled=False,
     subscribe=1,
     unsubscribe=1,
+    profiles=None,
+    failing=None,
+    unavailable=False,
 ):
     """Set test mock parameters."""
     MODEL_SIZES[0]["tenants"] = tenants
@@ -192,7 +201,23 @@ def set_size(
     MODEL_SIZES[0]["getdevcount"] = getdevcount
     MODEL_SIZES[0]["subscribe"] = subscribe
     MODEL_SIZES[0]["unsubscribe"] = unsubscribe
+    MODEL_SIZES[0]["profiles"] = profiles
+    MODEL_SIZES[0]["failing"] = failing
+    MODEL_SIZES[0]["unavailable"] = unavailable
     getdevcount[0] = 0
+    getprofilecount[0] = 0
+    listcount[0] = 0
+def check_available():
+    """Raise exception if ChirpStack server is set unavailable."""
+    if get_size("unavailable"):
+        raise Exception("ChirpStack server unavailable") # pylint: disable=broad-exception-raised
+
+def get_page(list_request, result):
+    """Get offset/limit page of mocked List request results."""
+    offset = getattr(list_request, "offset", None) or 0
+    listcount[0] += 1
+    return result[offset:offset + list_request.limit]
+
 class message:
     """Class to represent mqtt message."""
 
@@ -231,6 +256,8 @@ class mqtt:
         stat_devices = 0
         stat_sensors = 0
         _publish_queue = Queue()
+        _socket_pair = None
+        retained = {}   # topic -> payload delivered on matching subscribe - test extension, kept over connects
 
         def __init__(self, version):
             pass
@@ -261,12 +288,13 @@ class mqtt:
 
         def publish(self, topic, payload, qos=0, retain=True):
             """Mock publish function, raise exception if requested."""
-            self._publish_queue.put((topic, payload, qos, retain))
             self._publish_count += 1
+            mid = self._publish_count
+            self._publish_queue.put((topic, payload, qos, retain, mid))
             self._published.append((topic, payload, qos, retain))
             ret_val = lambda: None
             ret_val.rc = 0 if get_size("publish") else 1
-            ret_val.mid = self._publish_count
+            ret_val.mid = mid
             return ret_val
 
         def loop_start(self):
@@ -277,7 +305,25 @@ class mqtt:
             return self.loop()
 
         def loop_misc(self):
-            return self.loop()
+            return 0
+
+        def loop_write(self):
+            return 0
+
+        def want_write(self):
+            return False
+
+        def socket(self):
+            """Mock socket function: start message processing as network peer, return never readable socket."""
+            if self.on_connect:
+                reason_code = lambda: None
+                reason_code.is_failure = get_size("mqtt")==0
+                reason_code.value = 135
+                self.on_connect(None, None, None, reason_code, None)
+            if self._socket_pair is None:
+                mqtt.Client._socket_pair = socket.socketpair()
+            threading.Thread(target=self._loop_forever, daemon=True).start()
+            return self._socket_pair[0]
 
         def loop(self, timeout: float = 1):
             if self.on_connect:
@@ -328,6 +374,8 @@ class mqtt:
                         if self._stat_dev_eui != sub_topics[2]:
                             self._stat_dev_eui = sub_topics[2]
                             self.stat_devices += 1
+                if self.on_publish and msg[4] is not None:    # no acknowledgement for delivered retained messages
+                    self.on_publish(self, None, msg[4], None, None)
                 self._processing_done.set()
             return 0
 
@@ -335,6 +383,12 @@ class mqtt:
             """Mock subscribe function."""
             sub_topics = topic.split("/")
             self._subscribed.add(sub_topics[-1])
+            for retained_topic, payload in list(self.retained.items()):
+                retained_sub_topics = retained_topic.split("/")
+                if len(retained_sub_topics) == len(sub_topics) and all(
+                    sub_topic in ("+", retained_sub_topic) for sub_topic, retained_sub_topic in zip(sub_topics, retained_sub_topics)
+                ):
+                    self._publish_queue.put((retained_topic, payload, 0, True, None))
             return (0, 0) if get_size("subscribe") else (1,1)
 
         def unsubscribe(self, topic):
@@ -372,8 +426,8 @@ class mqtt:
             self._stat_dev_eui = None
 
         def wait_empty_queue(self):
-            """Blocks till loop_forever is executed - test extension."""
-            if self._connected:
+            """Blocks till loop_forever, bridge message workers and deferred bridge online phase are idle - test extension."""
+            while self._connected:
                 while True:
                     if not self._connected: break
                     if self._publish_queue.empty():
@@ -381,6 +435,14 @@ class mqtt:
                             self._processing_done.wait()
                         break
                     time.sleep(0.1)
+                bridge = getattr(self.on_message, "__self__", None)
+                dispatcher = getattr(bridge, "_dispatcher", None)
+                if dispatcher is not None and not dispatcher.is_idle():
+                    dispatcher.join()
+                    continue
+                if getattr(bridge, "_bridge_online_timer", None) is None or bridge._transport:
+                    break   # asyncio transport timers run on event loop, waiting would block them
+                time.sleep(0.1)
 
 
 class api:
@@ -392,6 +454,7 @@ class api:
 
         def List(self, listTenantsReq, metadata):
             """Get mocked list tenants request response."""
+            check_available()
             no_of_tenants = get_size("tenants")
             request = lambda: None
             if listTenantsReq.limit is not None:
@@ -401,6 +464,7 @@ class api:
                     tenant.name = f"TenantName{i}"
                     tenant.id = f"TenantId{i}"
                     request.result.append(tenant)
+                request.result = get_page(listTenantsReq, request.result)
             request.total_count = no_of_tenants
             return request
 
@@ -416,6 +480,7 @@ class api:
         """Prepare list tenants request object, initialize only used in test fields."""
         request = lambda: None
         request.limit = None
+        request.offset = None
         return request
 
     def CreateTenantRequest():
@@ -433,6 +498,7 @@ class api:
 
         def List(self, listApplicationsReq, metadata):
             """Get mocked applications list request response."""
+            check_available()
             no_of_applications = get_size("applications")
             request = lambda: None
             if listApplicationsReq.limit is not None:
@@ -442,16 +508,20 @@ class api:
                     appl.name = f"ApplicationName{i}"
                     appl.id = f"ApplicationId{i}"
                     request.result.append(appl)
+                request.result = get_page(listApplicationsReq, request.result)
             request.total_count = no_of_applications
             return request
 
         def Get(self, getApplicationsReq, metadata):
             """Get mocked applications list request response."""
+            check_available()
             no_of_applications = get_size("applications")
             for i in range(0, no_of_applications):
                 if getApplicationsReq.id == f"ApplicationId{i}":
                     request = lambda: None
                     request.application_id = getApplicationsReq.application_id
+                    request.application = lambda: None
+                    request.application.tenant_id = "TenantId0"
                     return request
             raise Exception("Application does not exist") # pylint: disable=broad-exception-raised
 
@@ -469,6 +539,7 @@ class api:
         """List applications request object."""
         request = lambda: None
         request.limit = None
+        request.offset = None
         return request
 
     def GetApplicationRequest():
@@ -491,6 +562,7 @@ class api:
 
         def List(self, listDevicesReq, metadata=None):
             """Get mocked list devices request response."""
+            check_available()
             no_of_devices = get_size("devices")
             request = lambda: None
             if listDevicesReq.limit is not None:
@@ -499,23 +571,28 @@ class api:
                     device = lambda: None
                     device.dev_eui = f"dev_eui{i}"
                     device.name = f"device_name{i}"
-                    device.device_profile_id = f"device_profile_id{i}"
+                    device.device_profile_id = f"device_profile_id{i % get_size('profiles')}"
                     device.device_status = lambda: None
                     device.device_status.battery_level = 95
                     device.device_status.external_power_source = (i % 2) == 1
                     device.last_seen_at = ""
+                    device.updated_at = f"updated{get_size('disabled')}"
                     request.result.append(device)
+                request.result = get_page(listDevicesReq, request.result)
             request.total_count = no_of_devices
             return request
 
         def Get(self, deviceReq, metadata):
             """Get mocked device request response."""
+            check_available()
             dev_no = int(deviceReq.dev_eui[7:])
+            if dev_no == get_size("failing"):
+                raise Exception("Device request failed") # pylint: disable=broad-exception-raised
             request = lambda: None
             request.device = lambda: None
             request.device.dev_eui = deviceReq.dev_eui
             request.device.name = f"device_name{dev_no}"
-            request.device.device_profile_id = f"device_profile_id{dev_no}"
+            request.device.device_profile_id = f"device_profile_id{dev_no % get_size('profiles')}"
             request.device.is_disabled = get_size("disabled")
             if getdevcount[0] <= 1:
                 request.last_seen_at = ""
@@ -535,6 +612,7 @@ class api:
         """Get list devices request object, only properties used in test are initialized."""
         request = lambda: None
         request.limit = None
+        request.offset = None
         request.application_id = None
         return request
 
@@ -550,12 +628,15 @@ class api:
 
         def List(self, listDeviceProfileReq, metadata):
             """Get response list object for device profile request."""
+            check_available()
             no_of_devices = get_size("devices")
             request = lambda: None
             if listDeviceProfileReq.limit is not None:
                 request.result = []
                 for i in range(0, no_of_devices):
                     device = lambda: None
+                    device.id = f"device_profile_id{i}"
+                    device.updated_at = f"updated{get_size('codec')}"
                     device.dev_eui = f"dev_eui{i}"
                     device.name = f"profile_name{i}"
                     device.device_profile_id = f"device_profile_id{i}"
@@ -563,13 +644,17 @@ class api:
                     device.device_status.battery_level = 95
                     device.device_status.external_power_source = (i % 2) == 0
                     request.result.append(device)
+                request.result = get_page(listDeviceProfileReq, request.result)
             request.total_count = no_of_devices
             return request
 
         def Get(self, deviceProfileReq, metadata):
             """Get response object for device profile request."""
+            check_available()
             dev_no = int(deviceProfileReq.id[17:])
+            getprofilecount[0] += 1
             request = lambda: None
+            request.updated_at = f"updated{get_size('codec')}"
             request.device_profile = lambda: None
             request.device_profile.id = deviceProfileReq.id
             request.device_profile.uplink_interval = 1
@@ -618,6 +703,14 @@ class api:
             ] = mac_version
             return request
 
+    def ListDeviceProfilesRequest():
+        """Prepare list device profiles request object, only properties needed for test created."""
+        request = lambda: None
+        request.limit = None
+        request.offset = None
+        request.tenant_id = None
+        return request
+
     def GetDeviceProfileRequest():
         """Prepare device profile request object, only properties needd for test created."""
         request = lambda: None
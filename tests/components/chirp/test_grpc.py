@@ -1,11 +1,18 @@
 """Test the Wan integration gRPC interface class."""
 
+from homeassistant.components.chirp.const import (
+    CONF_OPTIONS_GRPC_PAGE_SIZE,
+    CONF_OPTIONS_INCREMENTAL_RELOAD,
+    DOMAIN,
+    GRPCLIENT,
+    MQTTCLIENT,
+)
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from tests.components.chirp import common
 import asyncio
 
-from .patches import get_size, mqtt, set_size
+from .patches import get_size, getdevcount, getprofilecount, listcount, mqtt, set_size
 
 
 async def test_faulty_codec(hass: HomeAssistant):
@@ -85,3 +92,110 @@ async def test_codec_with_comment(hass: HomeAssistant):
         assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == 0
 
     await common.chirp_setup_and_run_test(hass, True, run_test_codec_with_comment)
+
+
+async def test_shared_device_profile(hass: HomeAssistant):
+    """Test devices sharing profile - profile fetched and codec evaluated once per reload."""
+
+    async def run_test_shared_device_profile(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(devices=4, codec=2, profiles=1)
+        await common.reload_devices(hass, config)
+        assert getprofilecount[0] == 1
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == get_size("devices")
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == get_size("sensors") * get_size("devices")
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_shared_device_profile)
+
+
+async def test_discovery_cache(hass: HomeAssistant):
+    """Test discovery codec results are reused from persistent cache on next reload."""
+
+    async def run_test_discovery_cache(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        discovery_cache = hass.data[DOMAIN][config.entry_id][GRPCLIENT]._discovery_cache
+        set_size(devices=2, codec=2)
+        await common.reload_devices(hass, config)
+        hits, misses = discovery_cache.hits, discovery_cache.misses
+        await common.reload_devices(hass, config)
+        assert discovery_cache.hits == hits + get_size("profiles")
+        assert discovery_cache.misses == misses
+        assert hass.data[DOMAIN][config.entry_id][MQTTCLIENT]._config_topics_unchanged == get_size("sensors") * get_size("devices")
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_discovery_cache)
+
+
+async def test_failing_device_request(hass: HomeAssistant):
+    """Test failing device details request - only that device is ignored."""
+
+    async def run_test_failing_device_request(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(devices=5, codec=2, failing=2)
+        await common.reload_devices(hass, config)
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == get_size("devices") - 1
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == get_size("sensors") * (get_size("devices") - 1)
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_failing_device_request)
+
+
+async def test_paged_device_list(hass: HomeAssistant):
+    """Test device list retrieved in pages of configured size."""
+
+    async def run_test_paged_device_list(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(devices=5, codec=2)
+        await common.reload_devices(hass, config)
+        assert listcount[0] == 3
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == get_size("devices")
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == get_size("sensors") * get_size("devices")
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_paged_device_list, config_data={CONF_OPTIONS_GRPC_PAGE_SIZE: 2}
+    )
+
+
+async def test_incremental_reload(hass: HomeAssistant):
+    """Test incremental reload refetches only changed devices and profiles."""
+
+    async def run_test_incremental_reload(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(devices=3, codec=2)
+        await common.reload_devices(hass, config)
+        set_size(devices=3, codec=2)
+        await common.reload_devices(hass, config)
+        assert getdevcount[0] == 0 and getprofilecount[0] == 0
+        assert hass.data[DOMAIN][config.entry_id][MQTTCLIENT]._config_topics_unchanged == get_size("sensors") * get_size("devices")
+        set_size(devices=3, codec=4)
+        await common.reload_devices(hass, config)
+        assert getdevcount[0] == 0 and getprofilecount[0] == get_size("profiles")
+        assert hass.data[DOMAIN][config.entry_id][MQTTCLIENT]._dev_sensor_count == get_size("sensors") * get_size("devices")
+        set_size(devices=3, codec=4, disabled=True)
+        await common.reload_devices(hass, config)
+        assert getdevcount[0] == get_size("devices") and getprofilecount[0] == 0
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_incremental_reload, config_data={CONF_OPTIONS_INCREMENTAL_RELOAD: True}
+    )
+
+
+async def test_visibility_snapshot(hass: HomeAssistant):
+    """Test device visibility is answered from device list snapshot without per device requests."""
+
+    async def run_test_visibility_snapshot(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        grpc_client = hass.data[DOMAIN][config.entry_id][GRPCLIENT]
+        set_size(devices=3, codec=2)
+        await common.reload_devices(hass, config)
+        getdevcount[0] = 0
+        getprofilecount[0] = 0
+        listcount[0] = 0
+        grpc_client.refresh_visibility_snapshot()
+        for dev_no in range(get_size("devices")):
+            visibility = grpc_client.get_device_visibility_info(f"dev_eui{dev_no}")
+            assert visibility == {"uplink_interval": 1, "device_status_req_interval": 71, "last_seen": 0}
+        assert getdevcount[0] == 0 and getprofilecount[0] == 0 and listcount[0] == 1
+        assert grpc_client.get_device_visibility_info(f"dev_eui{get_size('devices')}")["uplink_interval"] == 1
+        assert getdevcount[0] == 1
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_visibility_snapshot)
@@ -1,11 +1,32 @@
 """Test the ChirpStack LoRaWAN integration initilization path initiated from __init__.py."""
+import asyncio
+import glob
+import os
+
+from homeassistant.components.sensor import SensorDeviceClass
 from homeassistant.config_entries import ConfigEntryState
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.storage import STORAGE_DIR
 from tests.components.chirp import common
 from homeassistant.components.chirp.const import (
     CONF_MQTT_CHIRPSTACK_PREFIX,
+    CONF_MQTT_DISC,
+    CONF_OPTIONS_REVALIDATE_RETRY,
+    CONF_OPTIONS_STALE_STARTUP,
     BRIDGE_CONF_COUNT,
+    DOMAIN,
+    MQTTCLIENT,
+    STATISTICS_DEVICES,
+    STATISTICS_OVERFLOW,
+    STATISTICS_PUBLISH_RATE,
+    STATISTICS_PUBLISH_THROTTLED,
+    STATISTICS_QUEUE,
+    STATISTICS_SENSORS,
+    STATISTICS_STARTUP,
+    STATISTICS_UPDATED,
 )
+from homeassistant.components.chirp.sensor import SENSORS
 from .patches import get_size, message, mqtt, set_size
 
 async def test_entry_setup_unload(hass: HomeAssistant):
@@ -51,3 +72,81 @@ async def test_empty_chirpstack_prefix(hass: HomeAssistant):
         assert configs == 0
 
     await common.chirp_setup_and_run_test(hass, True, run_test_entry_setup_unload)
+
+
+async def test_stale_startup(hass: HomeAssistant):
+    """Test integration starts from cached device set while ChirpStack server is unavailable, revalidates later."""
+    for file_name in glob.glob(hass.config.path(STORAGE_DIR, "chirp_device_set_*")):
+        os.remove(file_name)
+
+    async def run_test_stale_startup(hass: HomeAssistant, entry):
+        assert entry.state is ConfigEntryState.LOADED
+        set_size(unavailable=True)
+        assert await hass.config_entries.async_reload(entry.entry_id)
+        assert entry.state is ConfigEntryState.LOADED
+        mqtt_client = hass.data[DOMAIN][entry.entry_id][MQTTCLIENT]
+        mqtt_client._client.on_message(mqtt_client._client, None, message(f"{entry.data.get(CONF_MQTT_DISC)}/status", "online"))
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert common.count_messages(r'/config$', r'dev_eui', keep_history=True) == get_size("sensors") * get_size("devices")
+        assert common.count_messages(r'/bridge/status$', r'"online"') >= 1
+        assert set(mqtt_client._devices) == {f"dev_eui{dev_no}" for dev_no in range(get_size("devices"))}
+        assert mqtt_client._dev_sensor_count == get_size("sensors") * get_size("devices")
+        assert not mqtt_client._grpc_client._application_checked
+
+        set_size()
+        await asyncio.sleep(1.5)
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert mqtt_client._grpc_client._application_checked
+        assert mqtt_client._config_topics_unchanged == get_size("sensors") * get_size("devices")
+        assert common.count_messages(r'/config$', r'dev_eui') == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_stale_startup,
+        config_data={CONF_OPTIONS_STALE_STARTUP: True, CONF_OPTIONS_REVALIDATE_RETRY: 1},
+    )
+
+
+async def test_stale_startup_malformed_cache(hass: HomeAssistant):
+    """Test integration starts without cached device set if device set file has unexpected structure."""
+
+    async def run_test_stale_startup_malformed_cache(hass: HomeAssistant, entry):
+        assert entry.state is ConfigEntryState.LOADED
+        file_names = glob.glob(hass.config.path(STORAGE_DIR, "chirp_device_set_*"))
+        assert file_names
+        for file_name, content in zip(file_names * 2, ('{"devices_v0": {}}', '{"devices": {"dev_eui0": 1}, "configs": {"t": "p"}, "fields": {}}')):
+            with open(file_name, "w", encoding="utf-8") as file:
+                file.write(content)
+            assert await hass.config_entries.async_reload(entry.entry_id)
+            assert entry.state is ConfigEntryState.LOADED
+            mqtt_client = hass.data[DOMAIN][entry.entry_id][MQTTCLIENT]
+            assert mqtt_client._device_set_cache.device_set is None
+            mqtt_client._client.on_message(mqtt_client._client, None, message(f"{entry.data.get(CONF_MQTT_DISC)}/status", "online"))
+            mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+            assert set(mqtt_client._devices) == {f"dev_eui{dev_no}" for dev_no in range(get_size("devices"))}
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_stale_startup_malformed_cache, config_data={CONF_OPTIONS_STALE_STARTUP: True},
+    )
+
+
+async def test_statistics_sensors(hass: HomeAssistant):
+    """Test bridge statistics sensors are created with valid device classes."""
+
+    async def run_test_statistics_sensors(hass: HomeAssistant, entry):
+        assert entry.state is ConfigEntryState.LOADED
+        await hass.async_block_till_done()
+        assert {description.key for description in SENSORS} == {
+            STATISTICS_SENSORS, STATISTICS_DEVICES, STATISTICS_UPDATED, STATISTICS_QUEUE, STATISTICS_OVERFLOW, STATISTICS_STARTUP,
+            STATISTICS_PUBLISH_RATE, STATISTICS_PUBLISH_THROTTLED,
+        }
+        for description in SENSORS:
+            assert description.device_class is None or description.device_class in SensorDeviceClass
+        entity_registry = er.async_get(hass)
+        for description in SENSORS:
+            entity_id = entity_registry.async_get_entity_id("sensor", DOMAIN, f"{entry.unique_id}_{description.key}")
+            assert hass.states.get(entity_id).attributes.get("device_class") == description.device_class
+        assert hass.states.get(
+            entity_registry.async_get_entity_id("sensor", DOMAIN, f"{entry.unique_id}_{STATISTICS_DEVICES}")
+        ).attributes.get("device_class") is None
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_statistics_sensors)
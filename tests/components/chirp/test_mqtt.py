@@ -1,11 +1,40 @@
 """Test the ChirpStack LoRa integration MQTT integration class."""
 
+import glob
+import json
+import os
+import resource
+import threading
 import time
+import timeit
 import asyncio
 
-from homeassistant.components.chirp.const import BRIDGE_CONF_COUNT, CONF_APPLICATION_ID
+from homeassistant.components.chirp.const import (
+    BRIDGE_CONF_COUNT,
+    CONF_APPLICATION_ID,
+    CONF_MQTT_DISC,
+    CONF_OPTIONS_ASYNCIO_TRANSPORT,
+    CONF_OPTIONS_COMPACT_DISCOVERY,
+    CONF_OPTIONS_DEVICE_DISCOVERY,
+    CONF_OPTIONS_DISCOVERY_TEMPLATES,
+    CONF_OPTIONS_MESSAGE_OVERFLOW_SIZE,
+    CONF_OPTIONS_MESSAGE_QUEUE_SIZE,
+    CONF_OPTIONS_ONLINE_PER_DEVICE,
+    CONF_OPTIONS_PUBLISH_RATE,
+    CONF_OPTIONS_PUBLISH_WINDOW,
+    CONF_OPTIONS_RESTORE_AGE,
+    CONF_OPTIONS_RESTORE_COMPLETION,
+    CONF_OPTIONS_VALUES_STORE,
+    DOMAIN,
+    MQTTCLIENT,
+)
+from homeassistant.components.chirp.dispatcher import KeyedDispatcher
+from homeassistant.components.chirp.publisher import ACK_TIMEOUT as PUBLISH_ACK_TIMEOUT, PublishScheduler
+from homeassistant.components.chirp.scheduler import TimerService
+from homeassistant.components.chirp.templates import add_template_paths, compile_fields_merge
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import STORAGE_DIR
 from tests.components.chirp import common
 
 from .patches import get_size, message, mqtt, set_size
@@ -19,8 +48,8 @@ async def test_extended_debug_level(hass: HomeAssistant):
     ):
         await hass.async_block_till_done()
         await common.reload_devices(hass, config)
-        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == get_size("devices")
-        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == get_size("devices") * get_size("sensors")
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == 0
+        assert hass.data[DOMAIN][config.entry_id][MQTTCLIENT]._config_topics_unchanged == get_size("devices") * get_size("sensors")
 
     await common.chirp_setup_and_run_test(
         hass, True, run_test_level_names_with_indexes, True
@@ -152,6 +181,7 @@ async def test_ha_status_received(hass: HomeAssistant):
             topic = f"application/{config.data.get(CONF_APPLICATION_ID)}/device/{dev_eui}/event/cur"
             msg = f'{{"time_stamp":{time.time()-200}}}'
             mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).on_message(mqtt.Client(mqtt.CallbackAPIVersion.VERSION2), None, message(topic, msg))
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
         await hass.async_block_till_done()
         config_topics = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
         # check for topic count matching device count
@@ -161,6 +191,7 @@ async def test_ha_status_received(hass: HomeAssistant):
             topic = f"application/{config.data.get(CONF_APPLICATION_ID)}/device/{dev_eui}/event/up"
             msg = f'{{"batteryLevel": 93,"object": {{"{dev_eui}": 9}},"rxInfo": [{{"rssi": -75,"snr": 6,"location": {{"latitude": 56.9,"longitude": 24.1}}}}]}}'
             mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).on_message(mqtt.Client(mqtt.CallbackAPIVersion.VERSION2), None, message(topic, msg))
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
         await hass.async_block_till_done()
         config_topics = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
         assert len(config_topics) == mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices
@@ -206,6 +237,7 @@ async def test_ha_status_received_with_debug_log(hass: HomeAssistant):
             topic = f"application/{config.data.get(CONF_APPLICATION_ID)}/device/{dev_eui}/event/cur"
             msg = f'{{"time_stamp":{time.time()-200}}}'
             mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).on_message(mqtt.Client(mqtt.CallbackAPIVersion.VERSION2), None, message(topic, msg))
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
         await hass.async_block_till_done()
         config_topics = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
         # check for topic count matching device count
@@ -217,6 +249,7 @@ async def test_ha_status_received_with_debug_log(hass: HomeAssistant):
             mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).on_message(
                 mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices, None, message(topic, msg)
             )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
         await hass.async_block_till_done()
         config_topics = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
         assert len(config_topics) == mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices
@@ -246,8 +279,724 @@ async def test_payload_join(hass: HomeAssistant):
             topic = f"application/{config.data.get(CONF_APPLICATION_ID)}/device/{dev_eui}/event/cur"
             msg = f'{{"time_stamp":{time.time()-200},"rxInfo":[{{"location":{{"altitude":11}}}}]}}'
             mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).on_message(mqtt.Client(mqtt.CallbackAPIVersion.VERSION2), None, message(topic, msg))
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
         await hass.async_block_till_done()
         config_topics = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
         assert len(config_topics) == mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices
 
     await common.chirp_setup_and_run_test(hass, True, run_test_payload_join)
+
+
+async def test_reload_stage_timings(hass: HomeAssistant):
+    """Test reload pipeline stages process all devices and report timings."""
+
+    async def run_test_reload_stage_timings(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(devices=3, codec=2)
+        await common.reload_devices(hass, config)
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == get_size("devices")
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert list(mqtt_client._reload_timings) == ["list", "fetch", "codec", "config", "publish"]
+        assert all(timing >= 0 for timing in mqtt_client._reload_timings.values())
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_reload_stage_timings)
+
+
+async def test_unchanged_config_not_republished(hass: HomeAssistant):
+    """Test only new/changed discovery configs are republished, disappeared devices are still removed."""
+
+    async def run_test_unchanged_config_not_republished(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        set_size(devices=3)
+        await common.reload_devices(hass, config)
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_devices == 1
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == get_size("sensors")
+        assert mqtt_client._config_topics_unchanged == 2 * get_size("sensors")
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        set_size(devices=2)
+        await common.reload_devices(hass, config)
+        assert common.count_messages(r'/config$', r' ', keep_history=True) == 0
+        assert common.count_messages_with_no_payload(r'/config$') == get_size("sensors")
+        assert mqtt_client._config_topics_unchanged == get_size("devices") * get_size("sensors")
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_unchanged_config_not_republished)
+
+
+async def test_retained_configs_not_republished_on_startup(hass: HomeAssistant):
+    """Test config hashes are seeded from retained configs before startup reload, unchanged configs are not republished."""
+
+    async def run_test_retained_configs_not_republished_on_startup(hass: HomeAssistant, entry: ConfigEntry):
+        await hass.async_block_till_done()
+        published = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published(keep_history=True)
+        retained = {topic: payload for topic, payload, qos, retain in published if retain and topic.endswith("/config")}
+        assert len(retained) == BRIDGE_CONF_COUNT + get_size("sensors") * get_size("devices")
+        mqtt.Client.retained = retained
+        try:
+            assert await hass.config_entries.async_reload(entry.entry_id)
+            mqtt_client = hass.data[DOMAIN][entry.entry_id][MQTTCLIENT]
+            mqtt_client._client.on_message(mqtt_client._client, None, message(f"{entry.data.get(CONF_MQTT_DISC)}/status", "online"))
+            mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+            await hass.async_block_till_done()
+        finally:
+            mqtt.Client.retained = {}
+        assert mqtt_client._config_topics_unchanged == get_size("sensors") * get_size("devices")
+        assert common.count_messages(r'/dev_eui\d+/[^/]+/config$', r' ', keep_history=True) == 0
+        assert common.count_messages(r'/bridge/status$', r'"online"') >= 1
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_retained_configs_not_republished_on_startup)
+
+
+async def test_device_offline_deadline(hass: HomeAssistant, caplog):
+    """Test device status is published on uplink and when its offline deadline expires, other devices are not touched."""
+
+    async def run_test_device_offline_deadline(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        for payload in ("not json", "[1]", "1"):    # malformed live messages are ignored
+            mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).publish(
+                f"application/{config.data.get(CONF_APPLICATION_ID)}/bridge/live", payload
+            )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert "Message processing failed" not in caplog.text
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).publish(
+            f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui0/event/up", '{"batteryLevel": 95}'
+        )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert common.count_messages(r'/dev_eui0/event/cur$', r'"status": "online"', keep_history=True) == 1
+        await asyncio.sleep(1.5)
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert common.count_messages(r'/dev_eui0/event/cur$', r'"status": "offline"', keep_history=True) == 1
+        assert common.count_messages(r'/dev_eui[1-9]/event/cur$', r'"status"', keep_history=True) == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_device_offline_deadline, config_data={CONF_OPTIONS_ONLINE_PER_DEVICE: 1}
+    )
+
+
+async def test_template_fields_tree(hass: HomeAssistant):
+    """Test payload fields tree is built from template syntax tree, paths without trailing blanks included."""
+
+    async def run_test_template_fields_tree(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(codec=2)
+        await common.reload_devices(hass, config)
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert mqtt_client._top_level_msg_names == {"object": {"counter": {}}, "rxInfo": [{"rssi": {}}]}
+        assert add_template_paths({}, "{{value_json.batteryLevel[-1]}}") == {"batteryLevel": {}}
+        assert add_template_paths({}, "{{value_json.object.temps[0]}}") == {"object": {"temps": {}}}
+        merge_values = compile_fields_merge(add_template_paths({}, "{{value_json.batteryLevel[-1]}}"))
+        values = merge_values({}, {"batteryLevel": [3.1, 3.0], "fCnt": 7})
+        assert values == {"batteryLevel": [3.1, 3.0]}
+        assert merge_values(values, {"fCnt": 8}) == {"batteryLevel": [3.1, 3.0]}
+        assert add_template_paths(
+            {}, '{{ (value_json["object"].power|float)/1000 if value_json.object.on else value_json.rxInfo[value_json.idx].snr }}'
+        ) == {"object": {"power": {}, "on": {}}, "rxInfo": [{"snr": {}}], "idx": {}}
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_template_fields_tree)
+
+
+async def test_compiled_merge_benchmark(hass: HomeAssistant, record_property):
+    """Compare compiled payload fields merge with recursive join_filtered_messages on ChirpStack uplink with rxInfo array, timings are reported only."""
+
+    async def run_test_compiled_merge_benchmark(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        fields_tree = {}
+        for template in (
+            "{{ value_json.object.counter }}",
+            "{{ value_json.object.power | float }}",
+            "{{ value_json.batteryLevel }}",
+            "{{ value_json.rxInfo[-1].rssi | int }}",
+            "{{ value_json.rxInfo[-1].snr }}",
+            "{{ value_json.rxInfo[-1].location.altitude | int }}",
+        ):
+            add_template_paths(fields_tree, template)
+        uplink = {
+            "deduplicationId": "3ac7e3c4-4401-4b8d-9386-a5c902f9202d",
+            "time": "2024-05-01T10:00:00.000000+00:00",
+            "deviceInfo": {"tenantId": "t0", "applicationId": "a0", "devEui": "dev_eui0", "tags": {}},
+            "devAddr": "01020304", "adr": True, "dr": 5, "fCnt": 10, "fPort": 85, "confirmed": False,
+            "data": "AXVkA2cAAQ==",
+            "object": {"counter": 5, "power": 12.5, "voltage": 230.1},
+            "rxInfo": [
+                {
+                    "gatewayId": f"gateway{i}", "uplinkId": i, "rssi": -70 - i, "snr": 7.5, "channel": 2,
+                    "location": {"latitude": 56.9, "longitude": 24.1, "altitude": 30},
+                    "context": "EFwMtA==", "metadata": {"region_config_id": "eu868", "region_common_name": "EU868"},
+                }
+                for i in range(3)
+            ],
+            "txInfo": {"frequency": 868100000, "modulation": {"lora": {"bandwidth": 125000, "spreadingFactor": 7}}},
+        }
+        merge_values = compile_fields_merge(fields_tree)
+        values = merge_values({}, uplink)
+        assert values == mqtt_client.join_filtered_messages({}, uplink, fields_tree)
+        assert merge_values(values, {"object": {"power": 1}}) == mqtt_client.join_filtered_messages(values, {"object": {"power": 1}}, fields_tree)
+        assert merge_values(None, None) == mqtt_client.join_filtered_messages(None, None, fields_tree)
+        assert len(values["rxInfo"]) == 3
+        assert values["rxInfo"][2] == {"rssi": -72, "snr": 7.5, "location": {"altitude": 30}}
+        scalar_fields_tree = add_template_paths({}, "{{ value_json.object.temps[0].value }}")
+        for old_payload, new_payload in (
+            ({}, {"object": {"temps": [21.5, 22.0, 22.5]}}),
+            ({"object": {"temps": [21.5]}}, {"object": {"temps": [{"value": 1, "unit": "C"}, 22.0]}}),
+            ({"object": {"temps": [{"value": 1}]}}, {"object": {"temps": None}}),
+            ({"object": {"temps": "n/a"}}, {"object": 5}),
+        ):
+            assert compile_fields_merge(scalar_fields_tree)(old_payload, new_payload) == mqtt_client.join_filtered_messages(
+                old_payload, new_payload, scalar_fields_tree
+            )
+        assert compile_fields_merge(scalar_fields_tree)({}, {"object": {"temps": [21.5, 22.0]}}) == {"object": {"temps": [21.5, 22.0]}}
+        assert compile_fields_merge(scalar_fields_tree)({}, {"object": {"temps": [{"value": 1, "unit": "C"}, 22.0]}}) == {
+            "object": {"temps": [{"value": 1}, 22.0]}
+        }
+        recursive_time = timeit.timeit(lambda: mqtt_client.join_filtered_messages(values, uplink, fields_tree), number=10000)
+        compiled_time = timeit.timeit(lambda: merge_values(values, uplink), number=10000)
+        record_property("join_filtered_messages_10000_uplinks_s", round(recursive_time, 3))
+        record_property("compiled_merge_10000_uplinks_s", round(compiled_time, 3))
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_compiled_merge_benchmark)
+
+
+async def test_device_event_routing(hass: HomeAssistant):
+    """Test device topics are routed by event type, events without handler are ignored."""
+
+    async def run_test_device_event_routing(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        routed = []
+        mqtt_client._event_handlers["join"] = lambda topic, route, payload_struct, time_stamp: routed.append(
+            (route["application"], route["dev_eui"], route["event"], payload_struct)
+        )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        for event in ("join", "ack"):
+            mqtt_client.on_message(
+                None, None, message(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui0/event/{event}", '{"devAddr": "01020304"}')
+            )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert routed == [(config.data.get(CONF_APPLICATION_ID), "dev_eui0", "join", {"devAddr": "01020304"})]
+        assert common.count_messages(r'/dev_eui0/event/cur$', None) == 0
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_device_event_routing)
+
+
+async def test_uplink_decoding(hass: HomeAssistant):
+    """Test raw uplink payload is decoded and only template fields are kept in device values."""
+
+    async def run_test_uplink_decoding(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        set_size(codec=2)
+        await common.reload_devices(hass, config)
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        uplink = {
+            "deviceInfo": {"devEui": "dev_eui0"},
+            "object": {"counter": 7, "voltage": 230},
+            "rxInfo": [{"gatewayId": f"gateway{i}", "rssi": -70 - i, "snr": 7.5} for i in range(3)],
+            "txInfo": {"frequency": 868100000},
+        }
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).publish(
+            f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui0/event/up", json.dumps(uplink).encode()
+        )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        cur_messages = [
+            json.loads(published[1])
+            for published in mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+            if published[0].endswith("/dev_eui0/event/cur")
+        ]
+        assert len(cur_messages) == 1
+        del cur_messages[0]["time_stamp"]
+        assert cur_messages[0] == {"object": {"counter": 7}, "rxInfo": [{"rssi": -70}, {"rssi": -71}, {"rssi": -72}]}
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_uplink_decoding)
+
+
+async def test_message_workers(hass: HomeAssistant):
+    """Test device messages are processed by worker pool keeping per device order, queue metrics are collected."""
+
+    async def run_test_message_workers(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        processed = []
+        processing_lock = threading.Lock()
+
+        def on_join_message(topic, route, payload_struct, time_stamp):
+            time.sleep(0.01)
+            with processing_lock:
+                processed.append((route["dev_eui"], payload_struct["fCnt"], threading.current_thread().name))
+
+        mqtt_client._event_handlers["join"] = on_join_message
+        processed_before = mqtt_client._dispatcher.processed
+        for f_cnt in range(10):
+            for dev_no in range(4):
+                mqtt_client.on_message(
+                    None, None, message(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui{dev_no}/event/join", f'{{"fCnt": {f_cnt}}}')
+                )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert len(processed) == 40
+        assert mqtt_client._dispatcher.processed - processed_before == 40
+        assert mqtt_client._dispatcher.max_queue_depth > 0
+        for dev_no in range(4):
+            device_messages = [item for item in processed if item[0] == f"dev_eui{dev_no}"]
+            assert [item[1] for item in device_messages] == list(range(10))
+            assert len({item[2] for item in device_messages}) == 1
+        assert len({item[2] for item in processed}) > 1
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_message_workers)
+
+
+async def test_dispatch_not_blocking_event_loop(hass: HomeAssistant):
+    """Test messages for busy worker with full queue are buffered in asyncio transport mode keeping dispatch order, buffer is limited."""
+
+    async def run_test_dispatch_not_blocking_event_loop(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        release = threading.Event()
+        processed = []
+        mqtt_client.dispatch(None, release.wait, 5)
+        start = time.monotonic()
+        for index in range(20):
+            mqtt_client.on_message(None, None, message(f"{config.data.get(CONF_MQTT_DISC)}/sensor/dev_eui{index}/entity/config", ""))
+            mqtt_client.dispatch(None, processed.append, index)
+        assert time.monotonic() - start < 1
+        assert mqtt_client._dispatcher.overflow_depth() > 0
+        assert mqtt_client._dispatcher.queue_depth() + mqtt_client._dispatcher.overflow_depth() >= 40
+        release.set()
+        mqtt_client._dispatcher.join()
+        assert processed == list(range(20))
+        assert mqtt_client._dispatcher.is_idle()
+        assert mqtt_client._dispatcher.overflow_depth() == 0
+
+        dispatcher = KeyedDispatcher(1, 2, overflow_size=3, name="chirp_test_worker")
+        release.clear()
+        processed.clear()
+        dispatcher.dispatch(None, release.wait, 5)
+        time.sleep(0.1)     # worker took blocking task from queue
+        for index in range(10):
+            dispatcher.dispatch(None, processed.append, index, block=False)
+        assert (dispatcher.queue_depth(), dispatcher.overflow_depth(), dispatcher.dropped) == (2, 3, 5)
+        dispatcher.dispatch_barrier(processed.append, "barrier", block=False)    # barrier is never dropped
+        release.set()
+        dispatcher.join()
+        assert processed == [0, 1, 2, 3, 4, "barrier"]
+        assert dispatcher.max_overflow_depth == 4
+        dispatcher.close()
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_dispatch_not_blocking_event_loop,
+        config_data={CONF_OPTIONS_ASYNCIO_TRANSPORT: True, CONF_OPTIONS_MESSAGE_QUEUE_SIZE: 5},
+    )
+
+
+async def test_asyncio_transport_reading_paused(hass: HomeAssistant):
+    """Test socket reading is paused while worker overflow is half full in asyncio transport mode, resumed once drained."""
+
+    async def run_test_asyncio_transport_reading_paused(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        release = threading.Event()
+        mqtt_client.dispatch(None, release.wait, 5)
+        for index in range(3):
+            mqtt_client.on_message(None, None, message(f"{config.data.get(CONF_MQTT_DISC)}/sensor/dev_eui{index}/entity/config", ""))
+        await asyncio.sleep(0.1)
+        assert mqtt_client._transport._reading_paused
+        release.set()
+        mqtt_client._dispatcher.join()
+        await asyncio.sleep(0.1)
+        assert not mqtt_client._transport._reading_paused
+        assert mqtt_client._dispatcher.dropped == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_asyncio_transport_reading_paused,
+        config_data={
+            CONF_OPTIONS_ASYNCIO_TRANSPORT: True, CONF_OPTIONS_MESSAGE_QUEUE_SIZE: 1, CONF_OPTIONS_MESSAGE_OVERFLOW_SIZE: 4,
+        },
+    )
+
+
+async def test_uplink_during_reload(hass: HomeAssistant):
+    """Test uplinks processed by device workers while devices are reloaded find their device records."""
+
+    async def run_test_uplink_during_reload(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        get_devices_conf_data = mqtt_client.get_devices_conf_data
+
+        def get_devices_conf_data_with_uplinks(devices):
+            for dev_no in range(get_size("devices")):
+                mqtt_client.on_message(
+                    None, None, message(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui{dev_no}/event/up", '{"batteryLevel": 95}')
+                )
+            time.sleep(0.3)     # uplinks of devices on other workers are processed meanwhile
+            yield from get_devices_conf_data(devices)
+
+        mqtt_client.get_devices_conf_data = get_devices_conf_data_with_uplinks
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        await common.reload_devices(hass, config)
+        assert common.count_messages(r'/event/cur$', r'time_stamp', keep_history=True) == get_size("devices")
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_uplink_during_reload)
+
+
+async def test_asyncio_transport_benchmark(hass: HomeAssistant, record_property):
+    """Compare thread count and context switches of loop_forever thread and asyncio transport modes on uplink flow, counts are reported only."""
+    results = {}
+
+    def get_context_switches():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_nvcsw + usage.ru_nivcsw
+
+    async def run_test_transport_benchmark(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        asyncio_transport = mqtt_client._transport is not None
+        threads = threading.active_count()
+        context_switches = get_context_switches()
+        for f_cnt in range(50):
+            mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).publish(
+                f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui{f_cnt % 4}/event/up", f'{{"fCnt": {f_cnt}}}'
+            )
+            await asyncio.sleep(0.01)
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        await asyncio.sleep(1.2)    # device offline deadlines expire
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        results[asyncio_transport] = (max(threads, threading.active_count()), get_context_switches() - context_switches)
+        assert common.count_messages(r'/dev_eui0/event/cur$', r'"status": "offline"') == 1
+
+    for asyncio_transport in (False, True):
+        await common.chirp_setup_and_run_test(
+            hass, True, run_test_transport_benchmark,
+            config_data={CONF_OPTIONS_ONLINE_PER_DEVICE: 1, CONF_OPTIONS_ASYNCIO_TRANSPORT: asyncio_transport},
+        )
+    for asyncio_transport, name in ((False, "loop_forever_thread"), (True, "asyncio_transport")):
+        record_property(f"{name}_threads", results[asyncio_transport][0])
+        record_property(f"{name}_context_switches", results[asyncio_transport][1])
+
+
+async def test_timer_service(hass: HomeAssistant):
+    """Test bridge delayed actions run on single timer service, timers order and cancellation with injected clock."""
+
+    async def run_test_timer_service(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert len(mqtt_client._timers) >= 1     # device check at least
+        assert [thread.name for thread in threading.enumerate()].count("chirp_timers") == 1
+
+        now = [100.0]
+        timers = TimerService(clock=lambda: now[0])
+        calls = []
+        timers.call_later(5, calls.append, "late")
+        timers.call_later(1, calls.append, "early")
+        timers.call_later(3, calls.append, "cancelled").cancel()
+        timers.call_later(3, calls.append, "middle")
+        timers.run_due()
+        assert calls == []
+        now[0] += 3
+        timers.run_due()
+        assert calls == ["early", "middle"]
+        assert len(timers) == 1
+        now[0] += 10
+        timers.run_due()
+        assert calls == ["early", "middle", "late"]
+        assert len(timers) == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_timer_service, config_data={CONF_OPTIONS_ONLINE_PER_DEVICE: 1}
+    )
+
+
+async def test_deferred_bridge_online(hass: HomeAssistant):
+    """Test device messages are processed while bridge online phase is deferred, startup duration is reported."""
+
+    async def run_test_deferred_bridge_online(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert mqtt_client._startup_duration > 0
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).publish(f"application/{config.data.get(CONF_APPLICATION_ID)}/bridge/restart", "")
+        for _ in range(500):
+            if mqtt_client._bridge_online_timer is not None:
+                break
+            await asyncio.sleep(0.01)
+        assert mqtt_client._bridge_online_timer is not None
+        mqtt_client.on_message(
+            None, None, message(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui0/event/up", '{"object": {"counter": 7}}')
+        )
+        mqtt_client._dispatcher.join()
+        assert mqtt_client._bridge_online_timer is not None
+        assert common.count_messages(r'/dev_eui0/event/cur$', r'"counter": 7', keep_history=True) == 1
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert mqtt_client._bridge_online_timer is None
+
+    await common.chirp_setup_and_run_test(hass, True, run_test_deferred_bridge_online)
+
+
+async def test_cur_window_completion(hass: HomeAssistant):
+    """Test cur window is closed by end of retained snapshot sentinel long before restore age limit."""
+
+    async def run_test_cur_window_completion(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert common.count_messages(r'/chirp_snapshot_end/event/cur$', r'"sentinel"') == 1
+        assert mqtt_client._cur_opened_count == 0
+        assert len(mqtt_client._cur_pending) == get_size("devices")
+        for dev_no in range(get_size("devices")):
+            mqtt_client.on_message(
+                None, None, message(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui{dev_no}/event/cur", f'{{"time_stamp": {time.time()}}}')
+            )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert len(mqtt_client._cur_pending) == 0
+
+        release = threading.Event()
+        mqtt_client.dispatch(None, release.wait, 5)    # sentinel is processed after window extension below
+        mqtt_client.enable_cur()
+        time.sleep(0.01)
+        mqtt_client.enable_cur()
+        release.set()
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert common.count_messages(r'/chirp_snapshot_end/event/cur$', r'"sentinel"') == 1
+        assert mqtt_client._cur_opened_count == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_cur_window_completion,
+        config_data={CONF_OPTIONS_RESTORE_COMPLETION: True, CONF_OPTIONS_RESTORE_AGE: 60},
+    )
+
+
+async def test_values_store_restore(hass: HomeAssistant):
+    """Test device values are written behind to local store and restored on next start without cur window."""
+    stored = {}
+    for file_name in glob.glob(hass.config.path(STORAGE_DIR, "chirp_values_*")):
+        os.remove(file_name)
+
+    async def run_test_values_store_write(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert mqtt_client._values_store is not None
+        for counter in range(5):
+            for dev_no in range(get_size("devices")):
+                mqtt_client.on_message(
+                    None, None, message(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui{dev_no}/event/up", f'{{"object": {{"counter": {counter}}}}}')
+                )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        mqtt_client._values_store.flush()
+        stored["writes"] = mqtt_client._values_store.writes
+        stored["batches"] = mqtt_client._values_store.batches
+
+    async def run_test_values_store_restore(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert mqtt_client._stored_values["dev_eui0"]["object"]["counter"] == 4
+        assert common.count_messages(r'/dev_eui0/event/up$', r'"counter": 4') == 1
+        assert mqtt_client._cur_opened_count == 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_values_store_write, config_data={CONF_OPTIONS_VALUES_STORE: True}
+    )
+    assert stored["writes"] == get_size("devices") and stored["batches"] == 1     # uplinks batched, latest values kept
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_values_store_restore, config_data={CONF_OPTIONS_VALUES_STORE: True}
+    )
+
+
+async def test_publish_scheduler(hass: HomeAssistant):
+    """Test discovery publishing is paced by rate limit and in-flight window, achieved rate is reported."""
+
+    async def run_test_publish_scheduler(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert mqtt_client._publisher.published == mqtt_client._dev_sensor_count
+        assert 0 < mqtt_client._publisher.max_in_flight <= 2
+        assert mqtt_client._publisher.in_flight() == 0
+        assert mqtt_client._publish_rate > 0
+        assert mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).stat_sensors == mqtt_client._dev_sensor_count
+
+        acks = []
+        scheduler = PublishScheduler(rate=50)
+        start = time.monotonic()
+        scheduler.begin()
+        for mid in range(60):
+            ret_val = lambda: None
+            ret_val.mid = mid
+            scheduler.publish(lambda ret_val: ret_val, ret_val)
+        assert time.monotonic() - start >= 0.15     # 50 message burst, 10 messages at 50 msg/s
+        assert scheduler.published == 60
+        assert scheduler.rate() <= 300
+
+        scheduler = PublishScheduler(window=1)
+        ret_val = lambda: None
+        ret_val.mid = 1
+        scheduler.publish(lambda: ret_val)
+        assert scheduler.in_flight() == 1
+        threading.Timer(0.1, scheduler.on_publish, (1,)).start()
+        ret_val_next = lambda: None
+        ret_val_next.mid = 2
+        scheduler.publish(lambda: ret_val_next)
+        assert scheduler.throttled >= 0.05
+        assert scheduler.in_flight() == 1
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_publish_scheduler,
+        config_data={CONF_OPTIONS_PUBLISH_RATE: 500, CONF_OPTIONS_PUBLISH_WINDOW: 2},
+    )
+
+
+async def test_config_echoes_while_publish_throttled(hass: HomeAssistant):
+    """Test config echoes filling reload worker queue do not stop publish acknowledgements of in-flight window."""
+
+    async def run_test_config_echoes_while_publish_throttled(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        set_size(devices=10)
+        start = time.monotonic()
+        await common.reload_devices(hass, config)
+        assert time.monotonic() - start < PUBLISH_ACK_TIMEOUT
+        assert mqtt_client._publisher.published == get_size("sensors") * (get_size("devices") - 2)
+        assert 0 < mqtt_client._publisher.max_in_flight <= 2
+        assert mqtt_client._publish_throttled == round(mqtt_client._publisher.throttled, 3)
+        assert mqtt_client._dispatcher.max_overflow_depth > 0
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_config_echoes_while_publish_throttled,
+        config_data={CONF_OPTIONS_PUBLISH_WINDOW: 2, CONF_OPTIONS_MESSAGE_QUEUE_SIZE: 3},
+    )
+
+
+async def test_device_discovery(hass: HomeAssistant):
+    """Test single device-based discovery message per device with components map, disappeared device is removed."""
+
+    async def run_test_device_discovery(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        device_configs = [
+            published for published in mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published(keep_history=True)
+            if published[0].startswith(f"{config.data.get(CONF_MQTT_DISC)}/device/") and published[1]
+        ]
+        assert len(device_configs) == mqtt_client._dev_count
+        assert common.count_messages(r'^ha/(?!device/).*/dev_eui.*/config$', r' ', keep_history=True) == 0
+        assert len(mqtt_client._devices_config_topics) == mqtt_client._dev_count
+        payload_struct = json.loads(device_configs[0][1])
+        assert len(payload_struct["components"]) == get_size("sensors")
+        for component in payload_struct["components"].values():
+            assert component["platform"]
+            assert "device" not in component and "origin" not in component
+        assert payload_struct["device"]["via_device"] == mqtt_client._bridge_indentifier
+        assert mqtt_client._dev_sensor_count == mqtt_client._dev_count * get_size("sensors")
+
+        dev_count = mqtt_client._dev_count
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        set_size(devices=1)
+        await common.reload_devices(hass, config)
+        assert mqtt_client._dev_count < dev_count
+        assert common.count_messages(r'/config$', r' ', keep_history=True) == 0
+        assert common.count_messages_with_no_payload(r'^ha/device/.*/config$') == dev_count - mqtt_client._dev_count
+        assert mqtt_client._config_topics_unchanged == mqtt_client._dev_count
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_device_discovery, config_data={CONF_OPTIONS_DEVICE_DISCOVERY: True}
+    )
+
+
+async def test_compact_discovery_payload_size(hass: HomeAssistant, record_property):
+    """Compare discovery payload sizes of full, compact and compact device-based modes, compact payloads stay unchanged on reload."""
+    results = {}
+
+    async def run_test_compact_discovery(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        mode = (mqtt_client._compact_discovery, mqtt_client._device_discovery)
+        set_size(codec=2)
+        await common.reload_devices(hass, config)
+        results[mode] = mqtt_client._discovery_bytes // mqtt_client._dev_count
+        if mqtt_client._compact_discovery and not mqtt_client._device_discovery:
+            configs = [
+                json.loads(published[1])
+                for published in mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published(keep_history=True)
+                if published[0].endswith("/config") and published[1] and "dev_eui" in published[0]
+            ]
+            assert configs
+            for payload_struct in configs:
+                assert payload_struct["~"].startswith(f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui")
+                assert payload_struct["stat_t"].startswith("~/event/")
+                assert "state_topic" not in payload_struct and "device" not in payload_struct
+                assert payload_struct["dev"]["via_device"] == mqtt_client._bridge_indentifier
+        await common.reload_devices(hass, config)
+        assert mqtt_client._config_topics_unchanged == len(mqtt_client._devices_config_topics)
+        assert mqtt_client._bridge_online_timer is None
+
+    for compact_discovery, device_discovery in ((False, False), (True, False), (False, True), (True, True)):
+        await common.chirp_setup_and_run_test(
+            hass, True, run_test_compact_discovery,
+            config_data={CONF_OPTIONS_COMPACT_DISCOVERY: compact_discovery, CONF_OPTIONS_DEVICE_DISCOVERY: device_discovery},
+        )
+    for mode, name in (
+        ((False, False), "full"), ((True, False), "compact"), ((False, True), "device_based"), ((True, True), "compact_device_based"),
+    ):
+        record_property(f"{name}_discovery_bytes_per_device", results[mode])
+    assert results[(True, False)] < results[(False, False)]
+    assert results[(True, True)] < results[(False, True)] < results[(False, False)]
+
+
+async def test_discovery_templates(hass: HomeAssistant, record_property):
+    """Test profile discovery templates render the same payloads as per device preparation, config stage times are reported only."""
+    results = {}
+
+    async def run_test_discovery_templates(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        set_size(devices=100, codec=2, profiles=2)
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        await common.reload_devices(hass, config)
+        configs = {}
+        for topic, payload, *_ in mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published():
+            if topic.endswith("/config") and payload and "dev_eui" in topic:
+                payload_struct = json.loads(payload)
+                del payload_struct["time_stamp"]
+                configs[topic] = payload_struct
+        assert len(configs) == mqtt_client._dev_sensor_count
+        if mqtt_client._use_discovery_templates:
+            assert len(mqtt_client._discovery_templates) == 2
+        results[mqtt_client._use_discovery_templates] = (configs, mqtt_client._reload_timings["config"])
+        await common.reload_devices(hass, config)
+        assert mqtt_client._config_topics_unchanged == mqtt_client._dev_sensor_count
+
+    for discovery_templates in (False, True):
+        await common.chirp_setup_and_run_test(
+            hass, True, run_test_discovery_templates, config_data={CONF_OPTIONS_DISCOVERY_TEMPLATES: discovery_templates},
+        )
+    record_property("per_device_config_stage_100_devices", results[False][1])
+    record_property("templates_config_stage_100_devices", results[True][1])
+    assert results[True][0] == results[False][0]
+
+
+async def test_device_registry(hass: HomeAssistant):
+    """Test device records hold per device topics and availability, bridge availability element is not modified."""
+
+    async def run_test_device_registry(hass: HomeAssistant, config: ConfigEntry):
+        await hass.async_block_till_done()
+        mqtt_client = hass.data[DOMAIN][config.entry_id][MQTTCLIENT]
+        assert set(mqtt_client._devices) == {f"dev_eui{dev_no}" for dev_no in range(get_size("devices"))}
+        for dev_eui, record in mqtt_client._devices.items():
+            assert not hasattr(record, "__dict__")
+            assert record.cur_topic == f"application/{config.data.get(CONF_APPLICATION_ID)}/device/{dev_eui}/event/cur"
+            assert [element["topic"] for element in record.availability] == [record.cur_topic]
+        assert mqtt_client._availability_element[0]["topic"].endswith("/bridge/status")
+
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).get_published()
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).publish(
+            f"application/{config.data.get(CONF_APPLICATION_ID)}/device/dev_eui1/event/up", '{"batteryLevel": 95}'
+        )
+        mqtt.Client(mqtt.CallbackAPIVersion.VERSION2).wait_empty_queue()
+        assert "time_stamp" in mqtt_client._devices["dev_eui1"].values
+        assert mqtt_client._devices["dev_eui1"].status == "online"
+        assert mqtt_client._devices["dev_eui0"].values == {}
+
+        record = mqtt_client._devices["dev_eui1"]
+        await common.reload_devices(hass, config)
+        assert mqtt_client._devices["dev_eui1"] is not record
+        assert mqtt_client._devices["dev_eui1"].status is not None
+        assert mqtt_client._availability_element[0]["topic"].endswith("/bridge/status")
+
+    await common.chirp_setup_and_run_test(
+        hass, True, run_test_device_registry, config_data={CONF_OPTIONS_ONLINE_PER_DEVICE: 1}
+    )